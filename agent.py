@@ -1,43 +1,197 @@
 from collections import Counter
-import os, json, textwrap, re, time
+import os, json, textwrap, re, time, threading, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
+
+from backends import BackendPool
+from llm_cache import CACHE_SAMPLED, get_response_cache, make_cache_key
+from prompts import PromptPrefix
+from rate_limit import AIMDLimiter, RetryPolicy
+from tracing import annotate, record_usage, span, traced
+import validators
+import strips
+import sandbox
+import calculator
+import routing
+import replay
 
 API_KEY  = os.getenv("OPENAI_API_KEY", "cse476")
 API_BASE = os.getenv("API_BASE", "http://10.4.58.53:41701/v1")  
 MODEL    = os.getenv("MODEL_NAME", "bens_model")              
 
-def call_model_chat_completions(prompt: str,
-                                system: str = "You are a helpful assistant. Reply with only the final answer—no explanation.",
-                                model: str = MODEL,
-                                temperature: float = 0.0,
-                                timeout: int = 60) -> dict:
-    """
-    Calls an OpenAI-style /v1/chat/completions endpoint and returns:
-    { 'ok': bool, 'text': str or None, 'raw': dict or None, 'status': int, 'error': str or None, 'headers': dict }
-    """
-    url = f"{API_BASE}/chat/completions"
+# size of the shared keep-alive connection pool (per host)
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+# transient failures (429, 5xx, timeouts) are retried with backoff, and the number of
+# in-flight requests adapts to 429s (see rate_limit.py). Both can be swapped out by assigning
+RETRY_POLICY = RetryPolicy(max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")))
+LIMITER      = AIMDLimiter(initial=int(os.getenv("LLM_INITIAL_INFLIGHT", "8")), max_limit=POOL_SIZE)
+
+# per-domain model / token budget / CoT votes and escalation (see routing.py). SMALL_MODEL_NAME
+# serves the cheap domains and STRONG_MODEL_NAME the escalations; both default to MODEL.
+# ROUTING=0 sends every domain to MODEL with the original budget
+ROUTING = os.getenv("ROUTING", "1") != "0"
+ROUTES  = (routing.build_policies(MODEL, os.getenv("SMALL_MODEL_NAME"), os.getenv("STRONG_MODEL_NAME"))
+           if ROUTING else routing.uniform_policies(MODEL))
+
+def route(domain: str) -> routing.RoutePolicy:
+    return ROUTES.get(domain, ROUTES[routing.DEFAULT_DOMAIN])
+
+# several replicas: API_BASES="http://a:8000/v1=2,http://b:8000/v1" (optional =weight) spreads
+# calls over them instead of API_BASE, see backends.py and get_backend_pool()
+API_BASES          = os.getenv("API_BASES", "")
+LB_STRATEGY        = os.getenv("LB_STRATEGY", "least_outstanding")
+HEALTH_INTERVAL    = float(os.getenv("BACKEND_HEALTH_INTERVAL", "5"))
+
+#===========================================================================
+# Shared HTTP client: one requests.Session reused by every call so
+# connections to the endpoint stay alive instead of being re-opened per request.
+# Use set_http_session() to inject a different session (e.g. for a local stub server)
+#===========================================================================
+
+_session = None
+_session_lock = threading.Lock()
+
+def make_http_session(pool_size: int = POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    # pool_connections = number of hosts kept, pool_maxsize = connections kept per host. The pool
+    # doesn't block when full (LIMITER already caps requests in flight): an extra connection is
+    # opened and closed after use instead of waiting without a time limit
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+def get_http_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = make_http_session()
+    return _session
+
+def set_http_session(session) -> None:
+    global _session
+    with _session_lock:
+        _session = session
+
+
+_backend_pool = None
+_backend_pool_lock = threading.Lock()
+# health probes get their own connections so a busy call pool can't hold them up
+_probe_session = None
+
+def probe_backend(url: str) -> bool:
+    """Health check used by the backend pool: the replica answers GET /models."""
+    global _probe_session
+    if _probe_session is None:
+        with _session_lock:
+            if _probe_session is None:
+                _probe_session = make_http_session(pool_size=1)
+    try:
+        return _probe_session.get(f"{url}/models", timeout=2).status_code == 200
+    except requests.RequestException:
+        return False
+
+def get_backend_pool():
+    """The BackendPool built from API_BASES, or None when calls go to API_BASE alone."""
+    global _backend_pool
+    if _backend_pool is None and API_BASES:
+        with _backend_pool_lock:
+            if _backend_pool is None:
+                pool = BackendPool.from_spec(API_BASES, strategy=LB_STRATEGY)
+                if HEALTH_INTERVAL > 0:
+                    pool.start_health_checks(probe_backend, HEALTH_INTERVAL)
+                _backend_pool = pool
+    return _backend_pool
+
+def set_backend_pool(pool) -> None:
+    global _backend_pool
+    with _backend_pool_lock:
+        _backend_pool = pool
+
+
+#===========================================================================
+# Per-question call counting: build_answers wraps each question in count_calls()
+# and every call_model_chat_completions made while solving it is tallied
+# (with its latency, and replay misses when replaying, see replay.py).
+# The counter lives in a ContextVar so it follows the question into the CoT
+# worker threads (see _map_in_context). A nested count_calls() also passes
+# its calls on to the enclosing one
+#===========================================================================
+
+class CallCounter:
+    def __init__(self, parent: "CallCounter" = None):
+        self.parent = parent
+        self.calls = 0
+        self.cached = 0
+        self.latency = 0.0
+        self.replay_misses = 0
+        self._lock = threading.Lock()
+
+    def add(self, cached: bool, latency: float = 0.0, replay_miss: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            if cached:
+                self.cached += 1
+            self.latency += latency or 0.0
+            if replay_miss:
+                self.replay_misses += 1
+        if self.parent is not None:
+            self.parent.add(cached, latency, replay_miss)
+
+_call_counter = contextvars.ContextVar("call_counter", default=None)
+
+class count_calls:
+    """ with count_calls() as counter: ... ; counter.calls / counter.cached / counter.latency afterwards """
+    def __enter__(self) -> CallCounter:
+        self.counter = CallCounter(parent=_call_counter.get())
+        self._token = _call_counter.set(self.counter)
+        return self.counter
+
+    def __exit__(self, *exc) -> None:
+        _call_counter.reset(self._token)
+
+def _count_call(result: dict) -> dict:
+    counter = _call_counter.get()
+    if counter is not None:
+        counter.add(result.get("cached", False), result.get("latency", 0.0), result.get("replay_miss", False))
+    return result
+
+def _map_in_context(pool: ThreadPoolExecutor, fn, items):
+    # each task runs in its own copy of the caller's context (a Context can't be entered twice at once)
+    items = list(items)
+    contexts = [contextvars.copy_context() for _ in items]
+    return pool.map(lambda ctx, item: ctx.run(fn, item), contexts, items)
+
+
+def _text_from_raw(data: dict) -> str:
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+def _texts_from_raw(data: dict) -> list:
+    return [(choice.get("message") or {}).get("content", "") for choice in data.get("choices", [])]
+
+def _ok_result(data: dict, status: int, headers: dict, cached: bool) -> dict:
+    message = (data.get("choices") or [{}])[0].get("message") or {}
+    return {"ok": True, "text": _text_from_raw(data), "texts": _texts_from_raw(data), "tool_calls": message.get("tool_calls") or [],
+            "raw": data, "status": status, "error": None, "headers": headers, "cached": cached}
+
+
+def _post_chat_completions(payload: dict, api_base: str, session: requests.Session, timeout: int) -> dict:
+    url = f"{api_base}/chat/completions"
     headers = {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type":  "application/json",
     }
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user",   "content": prompt}
-        ],
-        "temperature": temperature,
-        "max_tokens": 128,
-    }
-
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        resp = session.post(url, headers=headers, json=payload, timeout=timeout)
         status = resp.status_code
         hdrs   = dict(resp.headers)
         if status == 200:
-            data = resp.json()
-            text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            return {"ok": True, "text": text, "raw": data, "status": status, "error": None, "headers": hdrs}
+            return _ok_result(resp.json(), status, hdrs, cached=False)
         else:
             # try best-effort to surface error text
             err_text = None
@@ -45,9 +199,304 @@ def call_model_chat_completions(prompt: str,
                 err_text = resp.json()
             except Exception:
                 err_text = resp.text
-            return {"ok": False, "text": None, "raw": None, "status": status, "error": str(err_text), "headers": hdrs}
+            return {"ok": False, "text": None, "texts": [], "tool_calls": [], "raw": None, "status": status, "error": str(err_text), "headers": hdrs, "cached": False}
     except requests.RequestException as e:
-        return {"ok": False, "text": None, "raw": None, "status": -1, "error": str(e), "headers": {}}
+        return {"ok": False, "text": None, "texts": [], "tool_calls": [], "raw": None, "status": -1, "error": str(e), "headers": {}, "cached": False}
+
+
+#===========================================================================
+# Optional request features (n, tools, stream) are turned off for the rest of
+# the run only when the backend clearly doesn't support them: a 400/422 whose
+# error names the parameter, or several rejections in a row. Any other 400/422
+# (e.g. a context-length overflow) only makes that one call fall back.
+#===========================================================================
+
+class FeatureSupport:
+    def __init__(self, param_pattern: str, max_rejections: int = 3):
+        self.param_re = re.compile(param_pattern, re.IGNORECASE)
+        self.max_rejections = max_rejections
+        self.enabled = True
+        self.rejections = 0
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return self.enabled
+
+    def rejected(self, result: dict) -> bool:
+        """True if result is a 400/422 (the call should fall back); turns the feature off when it's clearly unsupported."""
+        if result["status"] not in (400, 422):
+            return False
+        with self._lock:
+            self.rejections += 1
+            if self.param_re.search(result.get("error") or "") or self.rejections >= self.max_rejections:
+                self.enabled = False
+        return True
+
+    def accepted(self) -> None:
+        with self._lock:
+            self.rejections = 0
+
+    def disable(self) -> None:
+        self.enabled = False
+
+
+#===========================================================================
+# Streaming: with LLM_STREAM=1, calls that pass stream_stop are sent with
+# stream: true and read as server-sent events. stream_stop(text) is called on the
+# partial completion each time a line ends; when it returns the text to keep, the
+# connection is closed so the server stops decoding the rest.
+# Turned off automatically if the backend rejects stream (see FeatureSupport).
+#===========================================================================
+
+STREAM = os.getenv("LLM_STREAM", "0") == "1"
+_stream_supported = FeatureSupport(r"\bstream")
+
+def _stream_events(resp: requests.Response):
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        yield json.loads(data)
+
+
+def _post_chat_completions_stream(payload: dict, api_base: str, session: requests.Session, timeout: int, stream_stop) -> dict:
+    url = f"{api_base}/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type":  "application/json",
+    }
+    try:
+        with session.post(url, headers=headers, json=dict(payload, stream=True), timeout=timeout, stream=True) as resp:
+            status = resp.status_code
+            hdrs   = dict(resp.headers)
+            if status != 200:
+                try:
+                    err_text = resp.json()
+                except Exception:
+                    err_text = resp.text
+                return {"ok": False, "text": None, "texts": [], "tool_calls": [], "raw": None, "status": status, "error": str(err_text), "headers": hdrs, "cached": False}
+
+            parts, usage, finish_reason, first_token_at, stopped, deltas = [], None, None, None, False, 0
+            for event in _stream_events(resp):
+                usage = event.get("usage") or usage
+                choice = (event.get("choices") or [{}])[0]
+                finish_reason = choice.get("finish_reason") or finish_reason
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                deltas += 1
+                if "\n" in delta:
+                    kept = stream_stop("".join(parts))
+                    if kept is not None:
+                        parts, finish_reason, stopped = [kept], "stop", True
+                        break
+            # leaving the with block closes the connection, which aborts the rest of the stream
+    except (requests.RequestException, ValueError) as e:
+        return {"ok": False, "text": None, "texts": [], "tool_calls": [], "raw": None, "status": -1, "error": str(e), "headers": {}, "cached": False}
+
+    if usage is None:
+        # usage only comes with the last event, so a cut stream has none; count the deltas instead
+        usage = {"completion_tokens": deltas}
+    data = {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": finish_reason}],
+        "usage": usage,
+        "stream_stopped": stopped,
+    }
+    result = _ok_result(data, status, hdrs, cached=False)
+    result["first_token_at"] = first_token_at
+    return result
+
+
+def _post_once(payload: dict, api_base: str, session: requests.Session, timeout: int, stream_stop=None) -> dict:
+    if stream_stop is not None:
+        result = _post_chat_completions_stream(payload, api_base, session, timeout, stream_stop)
+    else:
+        result = _post_chat_completions(payload, api_base, session, timeout)
+    result["backend"] = api_base
+    return result
+
+
+def _post_with_retry(payload: dict, api_base: str, session: requests.Session, timeout: int, stream_stop=None) -> dict:
+    # an explicit api_base bypasses the backend pool
+    pool = get_backend_pool() if api_base is None else None
+    api_base = api_base or API_BASE
+    tried = []
+    # backoff retries and replica switches are counted separately: failing over doesn't spend the retry budget
+    attempt = 0
+    failovers = 0
+    while True:
+        with LIMITER.slot() as slot:
+            if pool is None:
+                result = _post_once(payload, api_base, session, timeout, stream_stop)
+            else:
+                with pool.request(exclude=tried) as lease:
+                    result = _post_once(payload, lease.backend.url, session, timeout, stream_stop)
+                    lease.report(result["status"])
+                tried.append(lease.backend)
+            slot.report(result["status"])
+        result["retries"], result["failovers"] = attempt, failovers
+        if result["ok"] or result["status"] not in RETRY_POLICY.retry_statuses:
+            return result
+        # a failing replica is skipped right away; a 429 asks the client to slow down, so it backs off first
+        if pool is not None and result["status"] != 429 and pool.has_alternative(tried):
+            pool.record_failover()
+            failovers += 1
+            continue
+        if not RETRY_POLICY.should_retry(result["status"], attempt):
+            return result
+        time.sleep(RETRY_POLICY.delay(attempt, result["headers"].get("Retry-After")))
+        attempt += 1
+
+
+def _complete(payload: dict, cache, cache_key: str, api_base: str, session: requests.Session, timeout: int, stream_stop=None) -> dict:
+    if cache is not None:
+        data = cache.get(cache_key)
+        if data is not None:
+            return _ok_result(data, 200, {}, cached=True)
+
+    result = _post_with_retry(payload, api_base, session, timeout, stream_stop)
+    if result["ok"] and cache is not None:
+        cache.put(cache_key, result["raw"])
+    return result
+
+
+def _request_key(model: str, system, prompt, temperature: float, max_tokens: int, sample: int,
+                 conversation: dict, n: int, tools, tool_choice, streamed: bool) -> str:
+    # n, messages, tools and stream only join the key when used so existing entries stay valid
+    extra = dict(conversation)
+    if n > 1:
+        extra["n"] = n
+    if tools:
+        extra.update(tools=tools, tool_choice=tool_choice)
+    if streamed:
+        # a cut-off completion must not be served to a caller that wants the full text
+        extra["stream_stop"] = True
+    return make_cache_key(model, system, prompt, temperature, max_tokens, sample, **extra)
+
+
+def _replayed_result(store: replay.CallStore, key: str, label: str) -> dict:
+    entry = store.lookup(key, label)
+    if entry is None:
+        # the same failure every time, so a replayed run is reproducible
+        return {"ok": False, "text": None, "texts": [], "tool_calls": [], "raw": None, "status": -1,
+                "error": "replay miss: request not in the recorded calls", "headers": {}, "cached": False,
+                "replay_miss": True, "latency": 0.0, "ttft": None}
+    result = _ok_result(entry["raw"], 200, {}, cached=entry["cached"])
+    result.update(replayed=True, latency=entry["latency"], ttft=entry["ttft"])
+    return result
+
+
+def call_model_chat_completions(prompt: str,
+                                system: str = "You are a helpful assistant. Reply with only the final answer—no explanation.",
+                                model: str = MODEL,
+                                temperature: float = 0.0,
+                                timeout: int = 60,
+                                api_base: str = None,
+                                session: requests.Session = None,
+                                max_tokens: int = 128,
+                                sample: int = 0,
+                                use_cache: bool = None,
+                                n: int = 1,
+                                messages: list = None,
+                                tools: list = None,
+                                tool_choice=None,
+                                stream_stop=None) -> dict:
+    """
+    Calls an OpenAI-style /v1/chat/completions endpoint and returns:
+    { 'ok': bool, 'text': str or None, 'texts': list, 'tool_calls': list, 'raw': dict or None, 'status': int, 'error': str or None, 'headers': dict, 'cached': bool }
+    api_base defaults to the backend pool when API_BASES is set (with failover between
+    replicas, 'backend' in the result says which one answered), otherwise to API_BASE;
+    session defaults to the shared pooled session.
+    Successful responses are cached on disk (see llm_cache.py). By default only
+    deterministic calls (temperature 0) are: a cached sampled call would return the same
+    "random" vote on every rerun. use_cache=True (or LLM_CACHE_SAMPLED=1) caches sampled
+    calls too, keyed by sample; use_cache=False bypasses the cache.
+    n > 1 asks the server for several choices in one request; 'texts' holds all of them
+    and 'text' is the first one.
+    messages replaces the system + prompt pair with a full conversation (prompt is then
+    ignored), and tools / tool_choice enable native tool calling ('tool_calls' in the result).
+    stream_stop(partial_text) -> kept_text or None lets a streamed call end early (see
+    STREAM); it is ignored unless streaming is on and n == 1 without tools.
+    The result also has 'ttft' (seconds to the first token, None on failure) and 'latency'
+    (seconds for the whole call, retries included).
+    With a replay.CallStore active, successful calls are recorded to it, or (replay mode)
+    served from it without touching the network or the cache; an unrecorded request then
+    fails with 'replay_miss' set and the recorded 'latency' / 'ttft' are reported.
+    Each call is counted for count_calls() and traced as an llm_call span.
+    """
+    if messages is None:
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user",   "content": prompt}
+        ]
+        conversation = {}
+    else:
+        system, prompt = None, None
+        conversation = {"messages": messages}
+
+    if not (STREAM and _stream_supported and n == 1 and not tools):
+        stream_stop = None
+
+    # a replayed run answers from the recorded calls (same key as the cache) and nothing else
+    store = replay.get_call_store()
+    if use_cache is None:
+        use_cache = temperature == 0 or CACHE_SAMPLED
+    cache = get_response_cache() if use_cache and not (store is not None and store.replaying) else None
+    key_fields = (model, system, prompt, temperature, max_tokens, sample, conversation, n, tools, tool_choice)
+    cache_key = None
+    if cache is not None:
+        cache_key = _request_key(*key_fields, streamed=stream_stop is not None)
+    # whether streaming was still on (_stream_supported) depends on the run, so it stays out of the replay key
+    store_key = _request_key(*key_fields, streamed=False) if store is not None else None
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if n > 1:
+        payload["n"] = n
+    if tools:
+        payload["tools"] = tools
+        if tool_choice is not None:
+            payload["tool_choice"] = tool_choice
+
+    with span("llm_call", model=model, temperature=temperature) as attrs:
+        if store is not None and store.replaying:
+            # prompts start with the shared static instructions, the tail tells them apart
+            label = f"{model}: ...{(prompt if prompt is not None else messages[-1].get('content') or '')[-80:]!r}"
+            result = _replayed_result(store, store_key, label)
+        else:
+            start = time.perf_counter()
+            result = _complete(payload, cache, cache_key, api_base, session or get_http_session(), timeout, stream_stop)
+            if stream_stop is not None and _stream_supported.rejected(result):
+                # the full reply belongs under the non-streamed request's key
+                stream_stop = None
+                if cache_key is not None:
+                    cache_key = _request_key(*key_fields, streamed=False)
+                result = _complete(payload, cache, cache_key, api_base, session or get_http_session(), timeout)
+            elif stream_stop is not None and result["ok"]:
+                _stream_supported.accepted()
+            result["latency"] = time.perf_counter() - start
+            # without streaming the first token arrives with the whole response
+            first_token_at = result.pop("first_token_at", None)
+            result["ttft"] = first_token_at - start if first_token_at is not None else (result["latency"] if result["ok"] else None)
+            if store is not None and result["ok"]:
+                store.record(store_key, result)
+        attrs.update(status=result["status"], cached=result["cached"], retries=result.get("retries", 0), failovers=result.get("failovers", 0), backend=result.get("backend"),
+                     ttft=result["ttft"], streamed=stream_stop is not None,
+                     stream_stopped=bool((result["raw"] or {}).get("stream_stopped")))
+        if store is not None and store.replaying:
+            attrs.update(replayed=result.get("replayed", False), replay_miss=result.get("replay_miss", False))
+        record_usage(attrs, result["raw"])
+    routing.REPORT.record_call(model, result)
+    return _count_call(result)
 
 ACTION_RE = re.compile(r"^\s*(CALCULATE|FINAL)\s*:\s*(.+?)\s*$", re.IGNORECASE | re.DOTALL)
 
@@ -121,7 +570,15 @@ def classify_domain(question:str) -> str:
         return "common sense"
     
 
-def make_first_prompt(question: str, domain: str) -> str:
+#===========================================================================
+# Prompt layout: every prompt is static instructions first and per-question
+# content last, so a server with prefix caching can reuse the shared prefix
+# across questions. The *_prefix() functions build each static part once per
+# domain (see prompts.py)
+#===========================================================================
+
+@lru_cache(maxsize=None)
+def first_prompt_prefix(domain: str) -> PromptPrefix:
     header = (
         "Global Output Guidelines:\n"
         " 1) You must return exactly one line only \n"
@@ -170,19 +627,22 @@ def make_first_prompt(question: str, domain: str) -> str:
             " - Include no explanations, reasoning steps, numbering or extra text in your final answer\n"
         )
 
-    return f"""{header}{domain_guidelines}
-Task:
-{question}
-
+    return PromptPrefix(SYSTEM_AGENT, f"""{header}{domain_guidelines}
 If you need to do any arithmetic calculations to solve the task, use the CALCULATE tool and reply as:
 CALCULATE: <expression>
 Otherwise, provide the final answer as:
-FINAL: <answer>"""
+FINAL: <answer>
+
+Task:
+""")
+
+def make_first_prompt(question: str, domain: str) -> str:
+    return first_prompt_prefix(domain).render(question)
 
 # Some none-math domains may still require calculation. The second prompt 
 # should remind the model of the domain and the format expected with that domain
-def make_second_prompt(question: str, result: str, domain: str) -> str:
-    
+@lru_cache(maxsize=None)
+def second_prompt_prefix(domain: str) -> PromptPrefix:
     if domain == "coding":
         reminder = ( "REMEMBER that you are solving a coding task. ")
     elif domain == "planning":
@@ -193,18 +653,20 @@ def make_second_prompt(question: str, result: str, domain: str) -> str:
         reminder = ( "REMEMBER that you are solving a common sense question and answering task. ")
     else: 
         reminder = ( "REMEMBER that you are solving a math problem. If the task doesn't explicitly mention any boxed notation (\\\\boxed), then <answer> should just be the plain number or alebraic expression WITHOUT \\\\boxed{...}. ")
-    return f"""The global output guidelines and {domain}-specific guidelines provided earlier still apply.
-For reference, here is the task:
-{question}
-
-CALCULATE tool results:
-{result}
-
+    return PromptPrefix(SYSTEM_AGENT, f"""The global output guidelines and {domain}-specific guidelines provided earlier still apply.
 {reminder} 
 If the task instructions contradict any of these guidelines, ALWAYS prioritize the task instructions.
+You will be given the task and the CALCULATE tool results. Provide the final answer. Reply exactly as: 
+FINAL: <answer>
+
+For reference, here is the task:
+""")
+
+def make_second_prompt(question: str, result: str, domain: str) -> str:
+    return second_prompt_prefix(domain).render(question, f"""
 
-Now provide the final answer. Reply exactly as: 
-FINAL: <answer>"""
+CALCULATE tool results:
+{result}""")
 
 
 
@@ -219,13 +681,31 @@ def parse_action(text: str):
     payload = m.group(2).strip()
     return action, payload
 
+# FINAL answers in these domains (plans, code) may continue on the following lines
+MULTILINE_DOMAINS = ("coding", "planning")
+
+def complete_action_prefix(text: str, domain: str):
+    """
+    stream_stop for the action protocol: returns text up to the end of the first line once
+    that line is a complete CALCULATE / single-line FINAL action, otherwise None (keep reading).
+    Free-form text is read to the end since the whole of it becomes the answer.
+    """
+    stripped = text.lstrip()
+    if "\n" not in stripped:
+        return None
+    line = stripped.split("\n", 1)[0]
+    m = ACTION_RE.match(line)
+    if not m:
+        return None
+    if m.group(1).upper() == "FINAL" and domain in MULTILINE_DOMAINS:
+        return None
+    return line
 
-def calculator_tool(expression: str):
-    allowed_names = {"round": round}
 
-    if re.search(r"[A-Za-z]", expression):
-        raise ValueError(f"Inalid calculate")
-    return eval(expression, {"__builtins__": {}}, allowed_names)
+def calculator_tool(expression: str):
+    """ Evaluates a CALCULATE expression with the AST-based whitelist evaluator
+    (calculator.py); raises ValueError for anything that isn't plain arithmetic """
+    return calculator.evaluate(expression)
 
 
 #===========================================================================
@@ -233,11 +713,17 @@ def calculator_tool(expression: str):
 # Runs only for math and planning domains
 # We make three separate passes
 # each with prompts of temp 0.2 to produce more diverse reasoning
+# The passes run concurrently and stop as soon as two of them agree
 # Model needs to think silently about whether the previous answer is logically correct
 #===========================================================================
 
-def single_pass_cot(question: str, previous_answer: str, system: str, domain: str, temperature: float = 0.2, verbose: bool = True) -> str:
-    cot_prompt = f"""
+@lru_cache(maxsize=None)
+def cot_prompt_prefix(domain: str) -> PromptPrefix:
+    if domain == "math":
+        system = "You are a correctness verifier for math problems."
+    else: #planning
+        system = "You are a correctness verifier for STRIPS planning tasks."
+    return PromptPrefix(system, f"""
 MANDATORY OUTPUT REQUIREMENTS:
     1) You must return only one line in this exact format:
     FINAL: <answer>
@@ -249,13 +735,20 @@ But if you find any mistakes, your next step is to re-solve and minimally change
 
 
 Question:
-{question}
+""")
+
+def make_cot_prompt(question: str, previous_answer: str, domain: str) -> str:
+    return cot_prompt_prefix(domain).render(question, f"""
 Proposed Final Answer:
 {previous_answer}
-"""
+""")
 
+def single_pass_cot(question: str, previous_answer: str, system: str, domain: str, temperature: float = 0.2, verbose: bool = True, sample: int = 0,
+                    model: str = MODEL, max_tokens: int = 128) -> str:
+    cot_prompt = make_cot_prompt(question, previous_answer, domain)
     
-    cot = call_model_chat_completions(prompt=cot_prompt, system=system, temperature=temperature)
+    cot = call_model_chat_completions(prompt=cot_prompt, system=system, model=model, temperature=temperature, max_tokens=max_tokens, sample=sample,
+                                      stream_stop=lambda text: complete_action_prefix(text, domain))
     if not cot["ok"]:
         raise RuntimeError(f"API error: {cot['error']}")
 
@@ -264,19 +757,87 @@ Proposed Final Answer:
     if action != "FINAL":
         return previous_answer.strip()
     return payload.strip()
-    
-def chain_of_thought(question: str, previous_answer: str, domain: str) -> str:
-    if domain == "math":
-        system = "You are a correctness verifier for math problems."
-    else: #planning
-        system = "You are a correctness verifier for STRIPS planning tasks."
-    
+
+# Server-side n-sampling: ask for all CoT samples in one request (choices=n)
+# instead of one request per sample. Turned off automatically if the backend rejects n
+# (see FeatureSupport) or ignores it.
+COT_USE_N = os.getenv("COT_USE_N", "0") == "1"
+# 'n', "n", `n`, "n must ...", "n > 1 ...", "n=1 only"; a bare \bn\b would also match escaped newlines
+_n_supported = FeatureSupport(r"""['"`]n['"`]|(?<![\w\\])n\s*(?:[=<>!]|must\b|should\b|is\b|not\b|param)""")
+
+def n_sampled_cot(question: str, previous_answer: str, system: str, domain: str, n: int, temperature: float = 0.2,
+                  model: str = MODEL, max_tokens: int = 128):
+    """
+    Returns a list of n CoT answers from a single request, or None when the
+    backend rejects n (error status or fewer choices than asked for).
+    """
+    cot = call_model_chat_completions(prompt=make_cot_prompt(question, previous_answer, domain),
+                                      system=system, model=model, temperature=temperature, max_tokens=max_tokens, n=n)
+    if _n_supported.rejected(cot):
+        return None
+    if cot["ok"] and len(cot["texts"]) < n:
+        # the backend ignores n
+        _n_supported.disable()
+        return None
+    if cot["ok"]:
+        _n_supported.accepted()
+    if not cot["ok"]:
+        raise RuntimeError(f"API error: {cot['error']}")
+
     cot_answers = []
-    for i in range(3):
-        cot_answer = single_pass_cot(question, previous_answer, system, domain, temperature=0.2, verbose=False)
-        cot_answers.append(cot_answer)
+    for text in cot["texts"]:
+        # one malformed choice shouldn't throw away the other samples
+        try:
+            action, payload = parse_action(text or "")
+        except ValueError:
+            continue
+        cot_answers.append(payload.strip() if action == "FINAL" else previous_answer.strip())
+    return cot_answers or [previous_answer.strip()]
+
+@traced("cot")
+def chain_of_thought(question: str, previous_answer: str, domain: str, passes: int = None) -> str:
+    policy = route(domain)
+    system = cot_prompt_prefix(domain).system
+    if passes is None:
+        passes = policy.cot_samples
+    if passes < 1:
+        return previous_answer.strip()
 
-    counts = Counter(cot_answers)
+    cot_answers = None
+    if COT_USE_N and _n_supported and passes > 1:
+        # None when the backend rejects n: fall back to one request per sample below
+        cot_answers = n_sampled_cot(question, previous_answer, system, domain, passes,
+                                    model=policy.model, max_tokens=policy.max_tokens)
+
+    def run_pass(i, model=policy.model):
+        return single_pass_cot(question, previous_answer, system, domain, temperature=0.2, verbose=False, sample=i,
+                               model=model, max_tokens=policy.max_tokens)
+
+    majority = passes // 2 + 1
+    escalated = []
+    with ThreadPoolExecutor(max_workers=max(majority, policy.escalate_samples)) as pool:
+        if cot_answers is None:
+            # Passes are issued concurrently, but only as many as can still change the vote:
+            # start with a bare majority and add passes only while no answer has reached it
+            # (with 3 passes: run 2 at once, and the 3rd only if they disagree)
+            cot_answers = []
+            while len(cot_answers) < passes:
+                top_count = Counter(cot_answers).most_common(1)[0][1] if cot_answers else 0
+                if top_count >= majority:
+                    break
+                needed = min(majority - top_count, passes - len(cot_answers))
+                start = len(cot_answers)
+                cot_answers.extend(_map_in_context(pool, run_pass, range(start, start + needed)))
+
+        # no majority: ask the escalation model for more votes
+        if policy.escalate_samples and Counter(cot_answers).most_common(1)[0][1] < majority:
+            routing.REPORT.record_escalation(domain, "split_vote")
+            start = len(cot_answers)
+            escalated = list(_map_in_context(pool, lambda i: run_pass(i, policy.escalation_model),
+                                             range(start, start + policy.escalate_samples)))
+
+    # escalated answers go first so they win ties
+    counts = Counter(escalated + cot_answers)
     top_answer, top_count = counts.most_common(1)[0]
     return top_answer.strip()
 
@@ -288,9 +849,9 @@ def chain_of_thought(question: str, previous_answer: str, domain: str) -> str:
 # asking the model to verify that the answer meets all requirements
 #===========================================================================
 
-def self_verification(question: str, previous_answer: str, domain: str, verbose: bool = True) -> str:
-    system = "You are a strict answer-format validator."
-    prompt = f"""
+@lru_cache(maxsize=None)
+def verification_prompt_prefix(domain: str) -> PromptPrefix:
+    return PromptPrefix("You are a strict answer-format validator.", f"""
 MANDATORY OUTPUT REQUIREMENTS:
     1) You must return only one line in this exact format:
     FINAL: <answer>
@@ -306,12 +867,22 @@ You will receive a question and a proposed final answer. Your job is to:
 
 
 Task:
-{question}
+""")
+
+@traced("verification")
+def self_verification(question: str, previous_answer: str, domain: str, verbose: bool = True, escalate: bool = False) -> str:
+    """ escalate: verify with the domain's escalation model instead of its first-pass model """
+    policy = route(domain)
+    prefix = verification_prompt_prefix(domain)
+    system = prefix.system
+    prompt = prefix.render(question, f"""
 Previous Final Answer:
 {previous_answer}
 
-"""
-    format_verification = call_model_chat_completions(prompt=prompt, system=system, temperature=0.0,)
+""")
+    format_verification = call_model_chat_completions(prompt=prompt, system=system, temperature=0.0,
+                                                      model=policy.escalation_model if escalate else policy.model, max_tokens=policy.max_tokens,
+                                                      stream_stop=lambda text: complete_action_prefix(text, domain))
     if not format_verification["ok"] or not format_verification["text"]:
         return previous_answer.strip()
         
@@ -348,13 +919,312 @@ def answer_normalizer(question: str, answer: str, domain: str):
     return  answer
 
 
+#===========================================================================
+# Native tool calling (optional, TOOL_CALLING=1): the calculator is offered as an
+# OpenAI-style function tool and its results are appended to one growing
+# conversation as tool messages, instead of re-sending the whole task through
+# make_second_prompt. Text CALCULATE/FINAL replies are still understood, and if
+# the backend rejects tools the run goes back to the text protocol (see FeatureSupport).
+#===========================================================================
+
+TOOL_CALLING = os.getenv("TOOL_CALLING", "0") == "1"
+_tools_supported = FeatureSupport(r"\btools?\b|tool_choice|function.call")
+
+CALCULATOR_TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "calculate",
+        "description": "Evaluates an arithmetic expression: numbers, + - * / // % **, parentheses, "
+                       "round, sqrt, log, exp, factorial, comb, Fraction.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "expression": {"type": "string", "description": "for example: round((3*2.49)*1.07, 2)"},
+            },
+            "required": ["expression"],
+        },
+    },
+}]
+
+def _calculate_for_model(expression: str) -> str:
+    try:
+        return str(calculator_tool(expression))
+    except Exception as e:
+        return f"ERROR: {e}. Do not calculate again, reply with FINAL: <answer>"
+
+def _run_tool_call(tool_call: dict) -> str:
+    try:
+        args = json.loads((tool_call.get("function") or {}).get("arguments") or "{}")
+    except json.JSONDecodeError:
+        return "ERROR: arguments were not valid JSON. Do not calculate again, reply with FINAL: <answer>"
+    return _calculate_for_model(str(args.get("expression", "")))
+
+def tool_calling_answer(question: str, domain: str, max_tool_uses: int = 3, verbose: bool = True):
+    """ Returns the proposed answer from a tool-calling conversation, or None when the
+    backend doesn't accept tools (the caller then falls back to the text protocol) """
+    policy = route(domain)
+    messages = [
+        {"role": "system", "content": SYSTEM_AGENT},
+        {"role": "user",   "content": make_first_prompt(question, domain)},
+    ]
+    tool_uses = 0
+    while True:
+        # once the tool budget is spent the model has to answer
+        tool_choice = "none" if tool_uses >= max_tool_uses else "auto"
+        with span("tool_round"):
+            r = call_model_chat_completions(prompt="", messages=messages, tools=CALCULATOR_TOOLS, tool_choice=tool_choice, temperature=0.0,
+                                            model=policy.model, max_tokens=policy.max_tokens)
+        if tool_uses == 0 and _tools_supported.rejected(r):
+            return None
+        if not r["ok"]:
+            raise RuntimeError(f"API error: {r['error']}")
+        _tools_supported.accepted()
+        if verbose: print("LLM →", r["text"] or r["tool_calls"])
+
+        if r["tool_calls"] and tool_uses < max_tool_uses:
+            messages.append({"role": "assistant", "content": r["text"] or None, "tool_calls": r["tool_calls"]})
+            for tool_call in r["tool_calls"]:
+                tool_uses += 1
+                with span("calculator"):
+                    result = _run_tool_call(tool_call)
+                if verbose: print("CALC =", result)
+                messages.append({"role": "tool", "tool_call_id": tool_call.get("id"), "content": result})
+            continue
+
+        text = (r["text"] or "").strip()
+        try:
+            action, payload = parse_action(text)
+        except ValueError:
+            return text
+        if action == "FINAL":
+            return payload.strip()
+        if tool_uses >= max_tool_uses:
+            raise RuntimeError("Exceeded tool-use limit.")
+        # text-protocol CALCULATE: answer it inside the same conversation
+        tool_uses += 1
+        with span("calculator"):
+            result = _calculate_for_model(payload)
+        if verbose: print("CALC =", result)
+        messages.append({"role": "assistant", "content": text})
+        messages.append({"role": "user", "content": f"CALCULATE tool results:\n{result}\n\nNow provide the final answer. Reply exactly as:\nFINAL: <answer>"})
+
 # ============================ MAIN AGENT LOOP ============================
 
+# sent when a CALCULATE expression can't be evaluated
+CALC_ERROR_PREFIX = PromptPrefix(SYSTEM_AGENT, """Your previous CALCULATE expression (shown after the task) was invalid because it was not a pure arithmetic expression.
+Moving forward DO NOT use CALCULATE at all. Skip straight to giving your final answer.
+MANDATORY OUTPUT REQUIREMENTS:
+    1) You must return only one line in this exact format:
+        FINAL: <answer>
+    2) <answer> HAS TO be the task's direct final answer (for example: if the answer to a task is 5, then <answer> must be 5 and NOT a meta-statement about whether or not the answer follows the format)
+    3) Do not include reasoning steps, explanations, or extra text
+Task:
+""")
+
+#===========================================================================
+# Planning: plans are simulated locally (strips.py) instead of asking the model
+# whether they are right. A valid plan is accepted as-is; an invalid one gets a
+# targeted repair prompt that names the failing step.
+#===========================================================================
+
+PLAN_REPAIR_ROUNDS = int(os.getenv("PLAN_REPAIR_ROUNDS", "2"))
+
+PLAN_REPAIR_PREFIX = PromptPrefix(SYSTEM_AGENT, """
+MANDATORY OUTPUT REQUIREMENTS:
+    1) You must return only one line in this exact format:
+    FINAL: <answer>
+    2) <answer> HAS TO be the complete corrected plan in the format required by the task, one action per line
+    3) Do not include reasoning steps, explanations, or extra text
+
+Your proposed plan (shown after the task) was simulated and it is NOT valid.
+Keep the steps before the failing step if they are still useful and fix the plan from there.
+
+Task:
+""")
+
+def make_plan_repair_prompt(question: str, plan: str, check: "strips.PlanCheck") -> str:
+    return PLAN_REPAIR_PREFIX.render(question, f"""
+Proposed plan:
+{plan}
+Problem found at step {check.step}: {check.reason}
+""")
+
+def check_and_repair_plan(question: str, plan: str, verbose: bool = True):
+    """ Returns a plan that passes the local simulation, or None if the problem can't
+    be parsed or no valid plan was found within PLAN_REPAIR_ROUNDS repairs """
+    with span("plan_check"):
+        check = strips.check_plan(question, plan)
+    if check is None:
+        return None
+
+    for _ in range(PLAN_REPAIR_ROUNDS):
+        if check.valid:
+            return plan
+        if verbose: print("Plan check →", check.step, check.reason)
+        with span("plan_repair"):
+            repaired = call_model_chat_completions(prompt=make_plan_repair_prompt(question, plan, check),
+                                                   system=PLAN_REPAIR_PREFIX.system, temperature=0.0)
+        if not repaired["ok"] or not repaired["text"]:
+            return None
+        try:
+            action, payload = parse_action(repaired["text"])
+        except ValueError:
+            return None
+        if action != "FINAL":
+            return None
+        plan = payload.strip()
+        with span("plan_check"):
+            check = strips.check_plan(question, plan)
+    return plan if check.valid else None
+
+#===========================================================================
+# Coding: candidate code is executed in a sandbox (sandbox.py) against the
+# examples found in the question. Passing code skips the verifier; failing
+# code gets one repair prompt with the error instead of another blind check.
+#===========================================================================
+
+CODE_SANDBOX = os.getenv("CODE_SANDBOX", "1") != "0"
+CODE_REPAIR_ROUNDS = int(os.getenv("CODE_REPAIR_ROUNDS", "1"))
+
+CODE_REPAIR_PREFIX = PromptPrefix(SYSTEM_AGENT, """
+MANDATORY OUTPUT REQUIREMENTS:
+    1) You must return only one line in this exact format:
+    FINAL: <answer>
+    2) <answer> HAS TO be the complete corrected code in the format required by the task
+    3) Do not include comments, reasoning steps, explanations, or extra text
+
+Your proposed code (shown after the task) was executed and it FAILED. Fix it using the error output.
+
+Task:
+""")
+
+def make_code_repair_prompt(question: str, code: str, result: "sandbox.SandboxResult") -> str:
+    return CODE_REPAIR_PREFIX.render(question, f"""
+Proposed code:
+{code}
+Error output ({result.status}):
+{result.detail}
+""")
+
+def check_and_repair_code(question: str, code: str, verbose: bool = True):
+    """ Returns (code, passed). passed is None when execution can't tell (no tests, missing
+    libraries, or the answer is not a complete definition) """
+    tests = sandbox.extract_tests(question)
+    if not tests or not re.search(r"^\s*(def|class)\s", sandbox.strip_code_fences(code), re.MULTILINE):
+        return code, None
+
+    pool = sandbox.get_sandbox_pool()
+    for attempt in range(CODE_REPAIR_ROUNDS + 1):
+        with span("sandbox"):
+            result = pool.run(sandbox.strip_code_fences(code), tests)
+        if result.status == "passed":
+            return code, True
+        if result.status not in ("failed", "timeout"):
+            return code, None
+        if verbose: print("Sandbox →", result.status, result.detail[:200])
+        if attempt == CODE_REPAIR_ROUNDS:
+            break
+        with span("code_repair"):
+            repaired = call_model_chat_completions(prompt=make_code_repair_prompt(question, code, result),
+                                                   system=CODE_REPAIR_PREFIX.system, temperature=0.0)
+        if not repaired["ok"] or not repaired["text"]:
+            break
+        try:
+            action, payload = parse_action(repaired["text"])
+        except ValueError:
+            break
+        if action != "FINAL":
+            break
+        code = payload.strip()
+    return code, False
+
+# skip the self-verification call when the local validators (validators.py) already
+# accept the answer's form (CoT still checks the content); EARLY_EXIT=0 always verifies
+EARLY_EXIT = os.getenv("EARLY_EXIT", "1") != "0"
+
+def _min_cot_calls(policy) -> int:
+    """ the fewest calls chain_of_thought makes under policy: one n-sampled request, or a bare majority """
+    if policy.cot_samples < 1:
+        return 0
+    if COT_USE_N and _n_supported and policy.cot_samples > 1:
+        return 1
+    return policy.cot_samples // 2 + 1
+
+def finalize_answer(question: str, proposed_answer: str, domain: str, verbose: bool = True, use_cot: bool = True) -> str:
+    """ CoT (math/planning, when use_cot) + self-verification + normalization of a proposed answer """
+    policy = route(domain)
+    use_cot = use_cot and domain in ["math", "planning"] and policy.cot_samples > 0
+    # an answer the simulator or the sandbox accepts skips CoT and the verifier (at least this
+    # many calls); the repair calls spent getting there count against it
+    skipped = (_min_cot_calls(policy) if use_cot else 0) + 1
+
+    simulated = domain == "planning" and strips.parse_problem(question) is not None
+    if simulated:
+        with count_calls() as repairs:
+            valid_plan = check_and_repair_plan(question, proposed_answer, verbose=verbose)
+        validators.STATS.record(valid_plan is not None, (skipped if valid_plan is not None else 0) - repairs.calls)
+        if valid_plan is not None:
+            return answer_normalizer(question, valid_plan, domain)
+
+    executed = False
+    if domain == "coding" and CODE_SANDBOX:
+        with count_calls() as repairs:
+            proposed_answer, passed = check_and_repair_code(question, proposed_answer, verbose=verbose)
+        executed = passed is not None
+        if executed:
+            validators.STATS.record(passed, (skipped if passed else 0) - repairs.calls)
+            if passed:
+                return answer_normalizer(question, proposed_answer, domain)
+
+    # reaching this point after the simulator or the sandbox ran means they rejected the answer
+    rejected = simulated or executed
+    skip_verifier = False
+    verdict = None
+    # well-formed isn't enough for a plan the simulator (or code the sandbox) just rejected
+    if EARLY_EXIT and not simulated and not executed:
+        verdict = validators.verdict(question, proposed_answer, domain)
+        skip_verifier = verdict is True
+        rejected = verdict is False
+
+    if use_cot:
+        # we do chain of thought for math and planning
+        cot_answer = chain_of_thought(question, proposed_answer, domain)
+        # an answer CoT changed has to pass the form check itself to skip the verifier
+        if skip_verifier and cot_answer != proposed_answer.strip():
+            skip_verifier = validators.verdict(question, cot_answer, domain) is True
+        proposed_answer = cot_answer
+    # no validator applies to most free-form answers; that is neither an accept nor a reject.
+    # A form check only stands in for the verifier call, never for the CoT check of the content
+    if verdict is not None:
+        validators.STATS.record(skip_verifier, 1 if skip_verifier else 0)
+    if skip_verifier:
+        if verbose: print("Validators → accepted", proposed_answer)
+        return answer_normalizer(question, proposed_answer.strip(), domain)
+    # a locally rejected answer is verified by the stronger model
+    escalate = rejected and policy.escalation_model != policy.model
+    if escalate:
+        routing.REPORT.record_escalation(domain, "validator_rejected")
+    final_answer = self_verification(question, proposed_answer, domain, verbose=verbose, escalate=escalate)
+    return answer_normalizer(question, final_answer, domain)
+
 def run_agent(question: str, max_tool_uses: int = 3, verbose: bool = True):
     # classify the domain
-    domain = classify_domain(question)
-
-    r1 = call_model_chat_completions(prompt=make_first_prompt(question, domain), system=SYSTEM_AGENT, temperature=0.0,)
+    with span("classify"):
+        domain = classify_domain(question)
+    annotate(domain=domain)
+
+    if TOOL_CALLING and _tools_supported:
+        proposed_answer = tool_calling_answer(question, domain, max_tool_uses=max_tool_uses, verbose=verbose)
+        if proposed_answer is not None:
+            return finalize_answer(question, proposed_answer, domain, verbose=verbose)
+
+    # only the first action line of these replies is used, so streamed calls can stop there
+    stream_stop = lambda text: complete_action_prefix(text, domain)
+    policy = route(domain)
+
+    with span("first_prompt"):
+        r1 = call_model_chat_completions(prompt=make_first_prompt(question, domain), system=first_prompt_prefix(domain).system, temperature=0.0,
+                                         model=policy.model, max_tokens=policy.max_tokens, stream_stop=stream_stop)
     if not r1["ok"]:
         raise RuntimeError(f"API error: {r1['error']}")
 
@@ -365,11 +1235,7 @@ def run_agent(question: str, max_tool_uses: int = 3, verbose: bool = True):
         action, payload = parse_action(r1["text"])
     except ValueError:
         proposed_answer = (r1["text"] or "").strip()
-        if domain in ["math", "planning"]:
-            proposed_answer = chain_of_thought(question, proposed_answer, domain)
-        
-        final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
-        return answer_normalizer(question, final_answer, domain)
+        return finalize_answer(question, proposed_answer, domain, verbose=verbose)
 
     tool_uses = 0
 
@@ -380,20 +1246,17 @@ def run_agent(question: str, max_tool_uses: int = 3, verbose: bool = True):
 
         # if LLM payload to calculator tool is wrong, ask the LLM again. This time, it cannot use calculator tool:
         try:
-            calc_value = calculator_tool(payload)
+            with span("calculator"):
+                calc_value = calculator_tool(payload)
         except Exception as e:
-            error_handler_prompt = f""" Your previous CALCULATE expression ({payload}) was invalid because it was not a pure arithmetic expression.
-            Moving forward DO NOT use CALCULATE atl all. Skip straight to giving your final answer. 
-            MANDATORY OUTPUT REQUIREMENTS:
-                1) You must return only one line in this exact format:
-                    FINAL: <answer>
-                2) <answer> HAS TO be the task's direct final answer (for example: if the answer to a task is 5, then <answer> must be 5 and NOT a meta-statement about whether or not the answer follows the format)
-                3) Do not include reasoning steps, explanations, or extra text
-            Task:
-            {question}
-            """
-
-            error_response = call_model_chat_completions(prompt=error_handler_prompt, system=SYSTEM_AGENT, temperature=0.0,)
+            error_handler_prompt = CALC_ERROR_PREFIX.render(question, f"""
+Invalid CALCULATE expression:
+{payload}
+""")
+
+            with span("calc_error_prompt"):
+                error_response = call_model_chat_completions(prompt=error_handler_prompt, system=CALC_ERROR_PREFIX.system, temperature=0.0,
+                                                             model=policy.model, max_tokens=policy.max_tokens, stream_stop=stream_stop)
             if not error_response["text"] or not error_response["ok"]:
                 return (payload or "").strip()
 
@@ -403,28 +1266,22 @@ def run_agent(question: str, max_tool_uses: int = 3, verbose: bool = True):
                 action, payload = parse_action(error_response["text"])
             except ValueError:
                 proposed_answer = (error_response["text"] or "").strip()
-                if domain in ["math", "planning"]:
-                    proposed_answer = chain_of_thought(question, proposed_answer, domain)
-                final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
-                
-                return answer_normalizer(question, final_answer, domain)
+                return finalize_answer(question, proposed_answer, domain, verbose=verbose)
             
             # the LLM is still trying to access the calculate tool, then just output the previous one
             if action != "FINAL":
                 proposed_answer = payload.strip()
-                final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
-                return answer_normalizer(question, final_answer, domain)
+                return finalize_answer(question, proposed_answer, domain, verbose=verbose, use_cot=False)
             
             proposed_answer = payload.strip()
-            if domain in ["math", "planning"]:
-                proposed_answer = chain_of_thought(question, proposed_answer, domain)
-            final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
-            return answer_normalizer(question, final_answer, domain)
+            return finalize_answer(question, proposed_answer, domain, verbose=verbose)
 
         if verbose: print("CALC =", calc_value)
 
         #ask model again with calculator result
-        rN = call_model_chat_completions(prompt=make_second_prompt(question,str(calc_value), domain), system=SYSTEM_AGENT, temperature=0.0,)
+        with span("second_prompt"):
+            rN = call_model_chat_completions(prompt=make_second_prompt(question,str(calc_value), domain), system=second_prompt_prefix(domain).system, temperature=0.0,
+                                             model=policy.model, max_tokens=policy.max_tokens, stream_stop=stream_stop)
         if not rN["ok"]:
             raise RuntimeError(f"API error: {rN['error']}")
         if verbose: print("LLM →", rN["text"])
@@ -433,25 +1290,11 @@ def run_agent(question: str, max_tool_uses: int = 3, verbose: bool = True):
             action, payload = parse_action(rN["text"])
         except ValueError:
             proposed_answer = (rN["text"] or "").strip()
-            if domain in ["math", "planning"]:
-                proposed_answer = chain_of_thought(question, proposed_answer, domain)
-        
-            final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
-            return answer_normalizer(question, final_answer, domain)
+            return finalize_answer(question, proposed_answer, domain, verbose=verbose)
     
-    proposed_answer = payload
-
-    if domain in ["math", "planning"]:
-        # we do chain of thought for these two domains
-        proposed_answer = chain_of_thought(question, proposed_answer, domain)
-    
-    final_answer = self_verification(question, proposed_answer, domain, verbose=verbose)
     # action must be FINAL here
-
-
-    final_answer = answer_normalizer(question, final_answer, domain)
-
-    return final_answer
+    proposed_answer = payload
+    return finalize_answer(question, proposed_answer, domain, verbose=verbose)
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,219 @@
+"""
+Client-side load balancing over several inference replicas.
+
+A BackendPool holds the base URLs of the replicas (each with a weight) and
+picks one per request:
+
+  * "least_outstanding": fewest requests in flight, relative to weight
+  * "ewma": lowest (EWMA latency x (in flight + 1)), relative to weight, so
+    a replica that slows down gets less traffic before it starts failing
+
+Replicas that fail failure_threshold requests in a row (connection errors,
+timeouts, 5xx) are taken out of rotation for cooldown seconds. An optional
+background thread also probes every replica (agent.py uses GET {url}/models):
+a failed probe takes it out early, a passing one brings it back. If every
+replica is down, all of them are tried anyway.
+
+    pool = BackendPool.from_spec("http://a:8000/v1=2,http://b:8000/v1")
+    with pool.request() as lease:
+        result = post(lease.backend.url)
+        lease.report(result["status"])
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+# statuses that say something about the replica rather than the request
+FAILURE_STATUSES = frozenset({-1, 500, 502, 503, 504})
+
+STRATEGIES = ("least_outstanding", "ewma")
+
+
+class Backend:
+    def __init__(self, url: str, weight: float = 1.0):
+        self.url = url.rstrip("/")
+        self.weight = weight
+        self.outstanding = 0
+        # seconds; None until the first successful request
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.marked_down = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "healthy": self.healthy(time.monotonic()),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "marked_down": self.marked_down,
+            "ewma_latency_s": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+        }
+
+
+def parse_spec(spec: str) -> List[Backend]:
+    """'http://a/v1=2, http://b/v1' -> [Backend(a, 2.0), Backend(b, 1.0)]"""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, sep, weight = item.rpartition("=")
+        try:
+            backends.append(Backend(url, float(weight)) if sep else Backend(item))
+        except ValueError:
+            # an '=' that isn't followed by a weight belongs to the URL
+            backends.append(Backend(item))
+    return backends
+
+
+class BackendPool:
+    def __init__(self, backends: Iterable[Backend], strategy: str = "least_outstanding",
+                 failure_threshold: int = 3, cooldown: float = 10.0, ewma_decay: float = 0.3):
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("BackendPool needs at least one backend")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy!r}")
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_decay = ewma_decay
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_spec(cls, spec: str, **kwargs) -> "BackendPool":
+        return cls(parse_spec(spec), **kwargs)
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+
+    def _cost(self, backend: Backend) -> float:
+        load = backend.outstanding + 1
+        if self.strategy == "ewma":
+            # replicas without a measurement yet look as fast as the fastest one, so they get tried
+            known = [b.ewma_latency for b in self.backends if b.ewma_latency is not None]
+            latency = backend.ewma_latency if backend.ewma_latency is not None else min(known, default=1.0)
+            load *= latency
+        return load / backend.weight
+
+    def choose(self, exclude: Iterable[Backend] = ()) -> Backend:
+        """Cheapest healthy backend not in exclude (falls back to unhealthy / excluded ones)."""
+        exclude = set(map(id, exclude))
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if id(b) not in exclude and b.healthy(now)]
+            if not candidates:
+                candidates = [b for b in self.backends if id(b) not in exclude] or self.backends
+            best = min(self._cost(b) for b in candidates)
+            backend = random.choice([b for b in candidates if self._cost(b) == best])
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, status: int, latency: float) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            if status in FAILURE_STATUSES:
+                backend.errors += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.failure_threshold and backend.healthy(time.monotonic()):
+                    backend.down_until = time.monotonic() + self.cooldown
+                    backend.marked_down += 1
+                return
+            backend.consecutive_failures = 0
+            if status == 200:
+                if backend.ewma_latency is None:
+                    backend.ewma_latency = latency
+                else:
+                    backend.ewma_latency += self.ewma_decay * (latency - backend.ewma_latency)
+
+    def request(self, exclude: Iterable[Backend] = ()) -> "_Lease":
+        return _Lease(self, exclude)
+
+    def has_alternative(self, tried: Iterable[Backend]) -> bool:
+        tried = set(map(id, tried))
+        now = time.monotonic()
+        with self._lock:
+            return any(id(b) not in tried and b.healthy(now) for b in self.backends)
+
+    def record_failover(self) -> None:
+        with self._lock:
+            self.failovers += 1
+
+    # ------------------------------------------------------------------
+    # Active health checks
+    # ------------------------------------------------------------------
+
+    def check_health(self, probe: Callable[[str], bool]) -> None:
+        """Runs probe(url) on every backend: failing ones leave the rotation, passing ones rejoin it."""
+        for backend in self.backends:
+            try:
+                ok = probe(backend.url)
+            except Exception:
+                ok = False
+            now = time.monotonic()
+            with self._lock:
+                if ok:
+                    backend.down_until = 0.0
+                    backend.consecutive_failures = 0
+                elif backend.healthy(now):
+                    backend.down_until = now + self.cooldown
+                    backend.marked_down += 1
+
+    def start_health_checks(self, probe: Callable[[str], bool], interval: float = 5.0) -> None:
+        if self._health_thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.check_health(probe)
+
+        self._health_thread = threading.Thread(target=loop, name="backend-health", daemon=True)
+        self._health_thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "failovers": self.failovers,
+                "backends": [b.as_dict() for b in self.backends],
+            }
+
+
+class _Lease:
+    def __init__(self, pool: BackendPool, exclude: Iterable[Backend]):
+        self.pool = pool
+        self.exclude = exclude
+        self.backend: Optional[Backend] = None
+        self.status = -1
+        self._start = 0.0
+
+    def report(self, status: int) -> None:
+        self.status = status
+
+    def __enter__(self) -> "_Lease":
+        self.backend = self.pool.choose(self.exclude)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.pool.release(self.backend, self.status, time.perf_counter() - self._start)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the agent.
+
+Starts a local MockChatServer, points the agent at it and runs build_answers
+over a synthetic question set, then reports questions/sec, model calls per
+question and per-question latency percentiles. The mock server also reports how much of
+the prompt traffic its simulated prefix cache covered and the mean
+time-to-first-token. No network access needed.
+
+    python benchmark.py --questions 200 --workers 16 --latency lognormal --mean 0.15 --error-rate 0.02
+    python benchmark.py --prefill-ms-per-token 0.5
+    python benchmark.py --decode-ms-per-token 5 --ramble-tokens 60 --stream
+    python benchmark.py --backends 3 --slow-backends 1 --dead-backends 1 --routing ewma
+    python benchmark.py --small-model small --decode-ms-per-token 3 --ramble-tokens 20
+    python benchmark.py --duplicate-rate 0.3 --dedup near
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import agent
+import dedup
+import routing
+from backends import STRATEGIES, Backend, BackendPool
+from generate_answer_template import build_answers, load_checkpoint
+from llm_cache import set_response_cache
+from mock_server import PREFIX_CACHE_BLOCKS, LatencyModel, MockChatServer
+from tracing import percentile
+import validators
+
+QUESTION_TEMPLATES = [
+    ("math", "What is {a} * {b}? Give only the number."),
+    ("math", "A store sells pens for {a} dollars each. How many dollars do {b} pens cost?"),
+    ("common sense", "Is it usually colder in winter than in summer in Canada? Answer YES or NO. ({a})"),
+    ("coding", "Write a python function solve(x) that returns x unchanged. Case {a}."),
+    ("planning", "[PLAN]\nAs initial conditions I have that block a is clear, block b is clear "
+                 "and the hand is empty. My goal is to have block a on top of block b. Instance {a}.\nMy plan is as follows:"),
+    ("future prediction", "You are an agent that can predict future events. Will event #{a} happen before {b}? "
+                          "Answer with a probability."),
+]
+
+
+def synthetic_questions(count: int, seed: int = 0, duplicate_rate: float = 0.0) -> List[Dict[str, Any]]:
+    """duplicate_rate of the questions repeat an earlier one, half verbatim and half with "Please " in front."""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        if questions and rng.random() < duplicate_rate:
+            original = rng.choice(questions)
+            text = original["input"] if rng.random() < 0.5 else "Please " + original["input"]
+            questions.append({"input": text, "domain": original["domain"]})
+            continue
+        domain, template = QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)]
+        questions.append({
+            "input": template.format(a=rng.randint(2, 99), b=rng.randint(2, 99)),
+            "domain": domain,
+        })
+    return questions
+
+
+def _merge_server_stats(servers: List[MockChatServer]) -> Dict[str, Any]:
+    merged: Dict[str, Any] = {}
+    ttft_total = 0.0
+    for server in servers:
+        stats = server.stats.as_dict()
+        ttft_total += stats.pop("mean_ttft_s") * (stats["requests"] - stats["errors"])
+        for key, value in stats.items():
+            merged[key] = merged.get(key, 0) + value
+    ok = merged["requests"] - merged["errors"]
+    merged["mean_ttft_s"] = round(ttft_total / ok, 4) if ok else 0.0
+    return merged
+
+
+def run_benchmark(questions: List[Dict[str, Any]], servers: List[MockChatServer], workers: int,
+                  strategy: str = "least_outstanding", dead_urls: List[str] = (),
+                  dedup_mode: str = dedup.DEDUP_MODE) -> Dict[str, Any]:
+    """Runs build_answers against servers and returns the measured metrics.
+    With more than one server (or any dead_urls) the agent load-balances over them."""
+    original_base = agent.API_BASE
+    agent.API_BASE = servers[0].url
+    pool = None
+    if len(servers) > 1 or dead_urls:
+        pool = BackendPool([Backend(s.url) for s in servers] + [Backend(url) for url in dead_urls], strategy=strategy)
+        pool.start_health_checks(agent.probe_backend, interval=1.0)
+        agent.set_backend_pool(pool)
+    # the benchmark measures the pipeline, not the response cache
+    set_response_cache(None)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Path(tmp) / "bench.checkpoint.jsonl"
+            start = time.perf_counter()
+            build_answers(questions, max_workers=workers, checkpoint_path=checkpoint, dedup_mode=dedup_mode)
+            elapsed = time.perf_counter() - start
+            records = load_checkpoint(checkpoint, len(questions))
+    finally:
+        agent.API_BASE = original_base
+        if pool is not None:
+            pool.close()
+            agent.set_backend_pool(None)
+
+    latencies = [r["latency"] for r in records.values()]
+    calls = [r["calls"] for r in records.values()]
+    failed = sum(1 for r in records.values() if r["output"] == "")
+    server_stats = _merge_server_stats(servers)
+    prompt_tokens = server_stats["prompt_tokens"]
+    result = {
+        "questions": len(questions),
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(len(questions) / elapsed, 2) if elapsed else 0.0,
+        "calls_per_question": round(sum(calls) / len(calls), 2) if calls else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        "empty_answers": failed,
+        "deduplicated": sum(1 for r in records.values() if "duplicate_of" in r),
+        "prefix_cache_hit_rate": round(server_stats["cached_prompt_tokens"] / prompt_tokens, 3) if prompt_tokens else 0.0,
+        "server_mean_ttft_s": server_stats["mean_ttft_s"],
+        "early_exit": validators.STATS.as_dict(),
+        "routing": routing.REPORT.as_dict(),
+        "server": server_stats,
+    }
+    if pool is not None:
+        result["backends"] = pool.stats()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the agent against a local mock endpoint.")
+    parser.add_argument("--questions", type=int, default=120)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--mean", type=float, default=0.05, help="mean (fixed/lognormal) server delay in seconds")
+    parser.add_argument("--low", type=float, default=0.01, help="uniform lower bound in seconds")
+    parser.add_argument("--high", type=float, default=0.1, help="uniform upper bound in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.0,
+                        help="simulated prefill cost per prompt token not covered by the server's prefix cache")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="disable the mock server's prefix cache")
+    parser.add_argument("--decode-ms-per-token", type=float, default=0.0, help="simulated decode cost per completion token")
+    parser.add_argument("--ramble-tokens", type=int, default=0,
+                        help="words of explanation the mock model adds after each reply's action line")
+    parser.add_argument("--stream", action="store_true", help="stream action replies and stop at the action line (agent.STREAM)")
+    parser.add_argument("--backends", type=int, default=1, help="number of mock replicas to load-balance over")
+    parser.add_argument("--slow-backends", type=int, default=0, help="how many of the replicas are 5x slower")
+    parser.add_argument("--dead-backends", type=int, default=0, help="extra replica URLs that refuse connections")
+    parser.add_argument("--routing", choices=STRATEGIES, default="least_outstanding")
+    parser.add_argument("--small-model", default=None,
+                        help="route the cheap domains to this model name (served --small-speedup times faster)")
+    parser.add_argument("--small-speedup", type=float, default=3.0)
+    parser.add_argument("--no-routing", action="store_true", help="send every domain to the base model (ROUTING=0)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="fraction of synthetic questions that repeat an earlier one")
+    parser.add_argument("--dedup", choices=dedup.MODES, default=dedup.DEDUP_MODE)
+    parser.add_argument("--tool-calling", action="store_true", help="use native tool calling (agent.TOOL_CALLING)")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--min-qps", type=float, default=None,
+                        help="exit with status 1 if throughput falls below this (for CI)")
+    args = parser.parse_args()
+
+    agent.TOOL_CALLING = args.tool_calling
+    agent.STREAM = args.stream
+    if args.no_routing:
+        agent.ROUTES = routing.uniform_policies(agent.MODEL)
+    else:
+        agent.ROUTES = routing.build_policies(agent.MODEL, small_model=args.small_model)
+    model_latency = {args.small_model: 1 / args.small_speedup} if args.small_model else None
+    questions = synthetic_questions(args.questions, seed=args.seed, duplicate_rate=args.duplicate_rate)
+    servers = []
+    for i in range(args.backends):
+        slow = 5 if i < args.slow_backends else 1
+        latency = LatencyModel(args.latency, mean=args.mean * slow, low=args.low * slow, high=args.high * slow)
+        servers.append(MockChatServer(latency=latency, error_rate=args.error_rate,
+                                      error_status=args.error_status, seed=args.seed + i,
+                                      prefill_seconds_per_token=args.prefill_ms_per_token / 1000,
+                                      prefix_cache_blocks=0 if args.no_prefix_cache else PREFIX_CACHE_BLOCKS,
+                                      decode_seconds_per_token=args.decode_ms_per_token / 1000,
+                                      ramble_tokens=args.ramble_tokens, model_latency=model_latency).start())
+    dead_urls = []
+    for _ in range(args.dead_backends):
+        # start and stop a server to get a port nothing listens on
+        dead = MockChatServer().start()
+        dead.stop()
+        dead_urls.append(dead.url)
+    try:
+        result = run_benchmark(questions, servers, args.workers, strategy=args.routing, dead_urls=dead_urls,
+                               dedup_mode=args.dedup)
+    finally:
+        for server in servers:
+            server.stop()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:<22} {value}")
+
+    if args.min_qps is not None and result["questions_per_s"] < args.min_qps:
+        print(f"FAIL: {result['questions_per_s']} questions/s is below --min-qps {args.min_qps}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
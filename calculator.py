@@ -0,0 +1,179 @@
+"""
+Safe arithmetic evaluator for the CALCULATE tool.
+
+Expressions are parsed with ast and only whitelisted nodes are evaluated:
+numbers, + - * / // % **, unary +/-, and calls to the functions in FUNCTIONS
+(round, sqrt, log, Fraction, ...). Exponents and result sizes are bounded so a
+single expression like 9**9**9 can't hang a worker. Results are memoized.
+
+    evaluate("round((3*2.49)*1.07, 2)")  ->  7.99
+"""
+
+from __future__ import annotations
+
+import ast
+import math
+import operator
+from fractions import Fraction
+from functools import lru_cache
+from typing import Union
+
+Number = Union[int, float, Fraction]
+
+MAX_EXPRESSION_CHARS = 500
+# largest allowed result, in decimal digits, for ints / Fractions
+MAX_DIGITS = 1000
+MAX_EXPONENT = 10_000
+MAX_FACTORIAL = 500
+
+
+class CalculatorError(ValueError):
+    pass
+
+
+def _check_size(value: Number) -> Number:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, complex):
+        # e.g. a negative base to a fractional power
+        raise CalculatorError("invalid expression: result is not a real number")
+    if isinstance(value, int) and value.bit_length() > MAX_DIGITS * 3.33:
+        raise CalculatorError(f"result has more than {MAX_DIGITS} digits")
+    if isinstance(value, Fraction) and max(value.numerator.bit_length(), value.denominator.bit_length()) > MAX_DIGITS * 3.33:
+        raise CalculatorError(f"result has more than {MAX_DIGITS} digits")
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        raise CalculatorError("result is not a finite number")
+    return value
+
+
+def _power(base: Number, exponent: Number) -> Number:
+    if isinstance(exponent, (int, Fraction)) and abs(exponent) > MAX_EXPONENT:
+        raise CalculatorError(f"exponent {exponent} is too large")
+    if isinstance(exponent, float) and abs(exponent) > MAX_EXPONENT:
+        raise CalculatorError(f"exponent {exponent} is too large")
+    # estimate the result size before computing it; a negative estimate is a tiny result, which is fine
+    if base not in (0, 1, -1) and exponent * math.log10(abs(float(base))) > MAX_DIGITS:
+        raise CalculatorError("result of ** is too large")
+    try:
+        return operator.pow(base, exponent)
+    except OverflowError as e:
+        raise CalculatorError(str(e)) from None
+
+
+def _factorial(n: Number) -> int:
+    if int(n) != n or n < 0:
+        raise CalculatorError("factorial() needs a non-negative integer")
+    if n > MAX_FACTORIAL:
+        raise CalculatorError(f"factorial() argument above {MAX_FACTORIAL}")
+    return math.factorial(int(n))
+
+
+def _bounded(fn):
+    # comb/perm of huge arguments would build enormous ints before any size check
+    def wrapper(n, *args):
+        if abs(n) > MAX_EXPONENT:
+            raise CalculatorError(f"{fn.__name__}() argument above {MAX_EXPONENT}")
+        return fn(n, *args)
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+
+def _round(number: Number, ndigits=None) -> Number:
+    # round(Fraction(1, 3), 10**9) or round(2, -10**9) would build a power of ten that size
+    if ndigits is not None and abs(ndigits) > MAX_DIGITS:
+        raise CalculatorError(f"round() ndigits above {MAX_DIGITS}")
+    return round(number, ndigits) if ndigits is not None else round(number)
+
+
+def _log(x: Number, base: Number = math.e) -> float:
+    return math.log(x, base)
+
+
+BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+}
+
+UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+FUNCTIONS = {
+    "round": _round,
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "log": _log,
+    "ln": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "exp": math.exp,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "factorial": _factorial,
+    "comb": _bounded(math.comb),
+    "perm": _bounded(math.perm),
+    "gcd": math.gcd,
+    "lcm": math.lcm,
+    "Fraction": Fraction,
+    "fraction": Fraction,
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+def _eval(node: ast.AST) -> Number:
+    if isinstance(node, ast.Expression):
+        return _eval(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return _check_size(node.value)
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+        return _check_size(BINARY_OPS[type(node.op)](_eval(node.left), _eval(node.right)))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+        return UNARY_OPS[type(node.op)](_eval(node.operand))
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+        args = [_eval(arg) for arg in node.args]
+        try:
+            return _check_size(FUNCTIONS[node.func.id](*args))
+        except CalculatorError:
+            raise
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise CalculatorError(f"{node.func.id}(): {e}") from None
+    raise CalculatorError(f"unsupported element in expression: {ast.dump(node)[:60]}")
+
+
+@lru_cache(maxsize=4096)
+def _evaluate(expression: str) -> Number:
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise CalculatorError(f"invalid expression: {e.msg}") from None
+    try:
+        return _eval(tree)
+    except ZeroDivisionError:
+        raise CalculatorError("division by zero") from None
+    except OverflowError as e:
+        raise CalculatorError(str(e)) from None
+
+
+def evaluate(expression: str) -> Number:
+    """Evaluates an arithmetic expression; raises CalculatorError (a ValueError) if it isn't allowed."""
+    expression = expression.strip().rstrip(".")
+    if len(expression) > MAX_EXPRESSION_CHARS:
+        raise CalculatorError("expression is too long")
+    return _evaluate(expression)
@@ -0,0 +1,215 @@
+"""
+Duplicate detection for a batch of questions, so each distinct question is
+solved once and its answer copied to the repeats.
+
+Two levels:
+
+  * exact: the same text after normalisation (Unicode NFKC, whitespace
+    collapsed, surrounding whitespace stripped);
+  * near: MinHash signatures over word 3-shingles, bucketed with LSH to find
+    candidate pairs, then confirmed with the exact shingle Jaccard
+    similarity (>= threshold). Similar is not the same question, so two
+    guards apply on top: both must contain exactly the same "key tokens"
+    (numbers, quoted strings, code-like identifiers, operators, in order),
+    and one may only add or drop filler words (articles, "please", ...)
+    relative to the other, never swap a word for another. "Solve 24 with
+    3 3 8 8" and "Solve 24 with 3 3 8 9" never merge, nor do two planning
+    instances that differ in one block colour, nor "blue and green" and
+    "blue or green".
+
+Near matching is opt-in (DEDUP=near / --dedup near); the default is exact.
+
+    groups = find_duplicates(texts, mode="near")
+    groups.canonical[i]   # index whose answer question i reuses (i itself if unique)
+    print(groups.format_report())
+
+DuplicateIndex does the same one question at a time, for streamed input;
+group_key(text) is equal for any two questions that could be merged.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+MODES = ("off", "exact", "near")
+DEDUP_MODE = os.getenv("DEDUP", "exact")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs above ~0.5 similarity become candidates, the threshold is checked exactly
+BANDS = 16
+_PRIME = (1 << 61) - 1
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_KEY_TOKEN_RE = re.compile(r"\"[^\"]*\"|'[^']*'|`[^`]*`|\w*\d\w*|\w+_\w+|\w+\(|[+\-*/=<>]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def key_tokens(text: str) -> List[str]:
+    """Numbers, quoted strings, identifiers and operators in order; near duplicates must agree on them."""
+    return _KEY_TOKEN_RE.findall(text)
+
+
+# words whose presence or absence doesn't change what is being asked; logical,
+# directional and modal words ("or", "below", "only", "can", ...) are deliberately left out
+FILLER_WORDS = frozenset("""
+a an the this these of please kindly you your me i we us our just
+following given question answer task using use numbers number
+""".split())
+
+
+def word_counts(text: str) -> Counter:
+    return Counter(w for w in _WORD_RE.findall(text.lower()) if w.isalnum() or "_" in w)
+
+
+def differ_only_in_filler(a: Counter, b: Counter) -> bool:
+    """True if one side only adds filler words to the other; a swap (words missing on both sides) is False."""
+    extra_a, extra_b = a - b, b - a
+    if extra_a and extra_b:
+        return False
+    return all(word in FILLER_WORDS for word in extra_a + extra_b)
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> frozenset:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, items: frozenset) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big") for item in items]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.params)
+
+
+@dataclass
+class DuplicateGroups:
+    canonical: List[int]
+    exact: int = 0
+    near: int = 0
+    # (duplicate, canonical, similarity) of every near-duplicate merge, for inspection
+    near_pairs: List[Tuple[int, int, float]] = field(default_factory=list)
+
+    @property
+    def unique(self) -> int:
+        return sum(1 for i, c in enumerate(self.canonical) if i == c)
+
+    def members(self) -> Dict[int, List[int]]:
+        """{canonical index: [duplicate indices]} for groups with at least one duplicate."""
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i, c in enumerate(self.canonical):
+            if i != c:
+                groups[c].append(i)
+        return dict(groups)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"questions": len(self.canonical), "unique": self.unique,
+                "exact_duplicates": self.exact, "near_duplicates": self.near}
+
+    def format_report(self) -> str:
+        total = len(self.canonical)
+        collapsed = total - self.unique
+        return (f"Dedup: {total} questions -> {self.unique} unique "
+                f"({self.exact} exact + {self.near} near duplicates collapsed, "
+                f"{collapsed / total if total else 0.0:.1%} less work)")
+
+
+class DuplicateIndex:
+    """
+    Incremental form of find_duplicates for questions that arrive one at a time:
+    add(text) returns the index of the earlier question it duplicates, or its own index.
+    """
+
+    def __init__(self, mode: str = DEDUP_MODE, threshold: float = DEDUP_THRESHOLD):
+        if mode not in MODES:
+            raise ValueError(f"Unknown dedup mode: {mode!r}")
+        self.mode = mode
+        self.threshold = threshold
+        self.groups = DuplicateGroups([])
+        # digest of the normalised text -> first index, so long questions aren't kept in memory
+        self._first_seen: Dict[bytes, int] = {}
+        # fingerprints of the unique questions, for near-duplicate checks
+        self._reps: Dict[int, Tuple[frozenset, List[str], Counter]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+        self._hasher = MinHasher() if mode == "near" else None
+
+    def add(self, text: str) -> int:
+        idx = len(self.groups.canonical)
+        canonical = self._find(idx, text)
+        self.groups.canonical.append(canonical)
+        return canonical
+
+    def _find(self, idx: int, text: str) -> int:
+        if self.mode == "off":
+            return idx
+        normalized = normalize(text)
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if digest in self._first_seen:
+            self.groups.exact += 1
+            return self._first_seen[digest]
+        if self.mode == "exact":
+            self._first_seen[digest] = idx
+            return idx
+
+        fingerprint = (shingles(normalized), key_tokens(normalized), word_counts(normalized))
+        signature = self._hasher.signature(fingerprint[0])
+        rows = NUM_PERM // BANDS
+        band_keys = [(band, signature[band * rows:(band + 1) * rows]) for band in range(BANDS)]
+        # the earliest confirmed match wins
+        for i in sorted({i for key in band_keys for i in self._buckets.get(key, ())}):
+            rep_shingles, rep_keys, rep_words = self._reps[i]
+            if rep_keys != fingerprint[1] or not differ_only_in_filler(rep_words, fingerprint[2]):
+                continue
+            similarity = jaccard(rep_shingles, fingerprint[0])
+            if similarity >= self.threshold:
+                # exact repeats of this wording go straight to the same question
+                self._first_seen[digest] = i
+                self.groups.near += 1
+                self.groups.near_pairs.append((idx, i, round(similarity, 3)))
+                return i
+
+        self._first_seen[digest] = idx
+        self._reps[idx] = fingerprint
+        for key in band_keys:
+            self._buckets[key].append(idx)
+        return idx
+
+
+def group_key(text: str) -> str:
+    """
+    Text that every possible duplicate of text shares: its key tokens and its non-filler
+    words. Questions with different group keys are never merged, so partitioning by it
+    (e.g. into shards) never splits a duplicate group.
+    """
+    normalized = normalize(text)
+    words = sorted((word, n) for word, n in word_counts(normalized).items() if word not in FILLER_WORDS)
+    return repr((key_tokens(normalized), words))
+
+
+def find_duplicates(texts: Sequence[str], mode: str = DEDUP_MODE, threshold: float = DEDUP_THRESHOLD) -> DuplicateGroups:
+    index = DuplicateIndex(mode, threshold)
+    for text in texts:
+        index.add(text)
+    return index.groups
@@ -11,88 +11,615 @@ an answers JSON file where each entry contains a string under the "output" key.
 
 from __future__ import annotations
 
+import argparse
+import hashlib
+import heapq
 import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import zip_longest
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
-from agent import run_agent
+import agent
+from agent import classify_domain, count_calls, run_agent
+from llm_cache import get_response_cache, set_response_cache
+from replay import CallStore, diff_runs, get_call_store, set_call_store
+from tracing import Tracer, trace_question
+import dedup
+import routing
+import validators
 
 INPUT_PATH = Path("cse_476_final_project_test_data.json")
 OUTPUT_PATH = Path("cse_476_final_project_answers.json")
+# append-only log with one JSON record per solved question; used to resume runs
+CHECKPOINT_PATH = Path("cse_476_final_project_answers.checkpoint.jsonl")
 
+_MISSING = object()
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
 
-def load_questions(path: Path) -> List[Dict[str, Any]]:
+
+def iter_json_records(path: Path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Yields the elements of a top-level JSON array, or the records of a JSONL file,
+    one at a time; only about chunk_size characters plus the current record are in memory.
+    """
+    decoder = json.JSONDecoder()
     with path.open("r", encoding="utf-8") as fp:
-        data = json.load(fp)
-    if not isinstance(data, list):
-        raise ValueError("Input file must contain a list of question objects.")
-    return data
+        buf = fp.read(chunk_size)
+        pos = len(buf) - len(buf.lstrip())
+        while pos == len(buf):
+            more = fp.read(chunk_size)
+            if not more:
+                return
+            buf, pos = more, len(more) - len(more.lstrip())
+        if buf[pos] != "[":
+            fp.seek(0)
+            for lineno, line in enumerate(fp, start=1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{path}:{lineno}: not a JSON array or JSONL file ({e.msg})") from None
+            return
+
+        pos += 1
+        eof = False
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos == len(buf):
+                    raise json.JSONDecodeError("incomplete", buf, pos)
+                record, end = decoder.raw_decode(buf, pos)
+                # a number at the end of the buffer ("12" or "1.") may continue in the next chunk
+                if not eof and (end == len(buf) or (buf[end] in _NUMBER_CHARS and isinstance(record, (int, float)))):
+                    raise json.JSONDecodeError("incomplete", buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"{path}: truncated or malformed JSON array") from None
+                more = fp.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield record
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+def iter_questions(path: Path) -> Iterator[Dict[str, Any]]:
+    for question in iter_json_records(path):
+        if not isinstance(question, dict):
+            raise ValueError("Input file must contain a list of question objects.")
+        yield question
+
+
+def load_questions(path: Path) -> List[Dict[str, Any]]:
+    return list(iter_questions(path))
+
+
+class AnswerWriter:
+    """
+    Writes answers to a JSON array as they arrive, byte-for-byte the same as
+    json.dump(answers, fp, ensure_ascii=False, indent=2). The file is written under
+    a temporary name and only renamed into place once the array is complete.
+    """
 
+    def __init__(self, path: Path):
+        self.path = path
+        self.count = 0
+        self._tmp = path.with_name(path.name + ".tmp")
+        self._fp = None
 
-def build_answers(questions: List[Dict[str, Any]]) -> List[Dict[str, str]]:
-    answers = []
+    def __enter__(self) -> "AnswerWriter":
+        self._fp = self._tmp.open("w", encoding="utf-8")
+        return self
 
-    for idx, question in enumerate(questions, start=1):
-        if idx % 10 == 0:
-            print(f"[{idx}] Solving question...", flush=True)
+    def write(self, answer: Dict[str, Any]) -> None:
+        item = json.dumps(answer, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._fp.write(("[\n  " if self.count == 0 else ",\n  ") + item)
+        self.count += 1
 
-        # Example: assume you have an agent loop that produces an answer string.
-        # real_answer = agent_loop(question["input"])
-        # answers.append({"output": real_answer})
-    
-        q = question.get("input", "")
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self._fp.write("\n]" if self.count else "[]")
+        self._fp.close()
+        if exc_type is None:
+            os.replace(self._tmp, self.path)
+        else:
+            self._tmp.unlink(missing_ok=True)
 
+
+def question_hash(question: Dict[str, Any]) -> str:
+    """Short hash of the question text; a checkpoint record only counts for the question it was solved for."""
+    return hashlib.sha1(question.get("input", "").encode("utf-8")).hexdigest()[:16]
+
+
+def solve_question(idx: int, question: Dict[str, Any], tracer: Optional[Tracer] = None) -> Dict[str, Any]:
+    """
+    Solves one question and returns its checkpoint record (idx is 0-based). If the agent
+    raises, the record has an empty output and "error": true, and is solved again on resume.
+    """
+    q = question.get("input", "")
+    start = time.perf_counter()
+    failed = False
+    with trace_question(tracer, idx), count_calls() as counter:
         try:
             final_answer = run_agent(q, verbose=False)
         except Exception as e:
-            print(f"ERROR on question {idx}", flush=True)
+            print(f"ERROR on question {idx + 1}: {e!r}", flush=True)
             final_answer = ""
+            failed = True
+    return {
+        "index": idx,
+        "input_hash": question_hash(question),
+        "output": final_answer,
+        **({"error": True} if failed else {}),
+        "domain": classify_domain(q),
+        "latency": round(time.perf_counter() - start, 3),
+        "calls": counter.calls,
+        "cached_calls": counter.cached,
+        # summed call latency; unlike "latency" it stays comparable when the calls are replayed
+        "llm_latency": round(counter.latency, 3),
+        **({"replay_misses": counter.replay_misses} if counter.replay_misses else {}),
+    }
+
+
+def load_checkpoint(path: Path, num_questions: Optional[int] = None,
+                    include_errors: bool = False) -> Dict[int, Dict[str, Any]]:
+    """
+    Reads the JSONL checkpoint into {index: record}; a torn last line is ignored, and so
+    are records of questions that failed ("error": true) unless include_errors is set.
+    """
+    records: Dict[int, Dict[str, Any]] = {}
+    if not path.exists():
+        return records
+    with path.open("r", encoding="utf-8") as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            idx = record.get("index")
+            if (isinstance(idx, int) and 0 <= idx and (num_questions is None or idx < num_questions)
+                    and isinstance(record.get("output"), str) and (include_errors or not record.get("error"))):
+                records[idx] = record
+    return records
+
+
+def open_checkpoint(path: Path) -> TextIO:
+    """Opens the checkpoint for appending; a torn last line (a crash mid-write) is ended first."""
+    torn = False
+    if path.exists() and path.stat().st_size > 0:
+        with path.open("rb") as fp:
+            fp.seek(-1, os.SEEK_END)
+            torn = fp.read(1) != b"\n"
+    fp = path.open("a", encoding="utf-8")
+    if torn:
+        # otherwise the next record would be glued onto the torn one and lost with it
+        fp.write("\n")
+    return fp
+
 
-        answers.append({"output": final_answer})
-        if (idx + 1) % 100 == 0:
-            with OUTPUT_PATH.open("w", encoding="utf-8") as fp:
-                json.dump(answers, fp, ensure_ascii=False, indent=2)
-            print(f"Checkpoint saved at {idx+1} question", flush=True)
+def stream_answers(
+    questions: Iterable[Any],
+    max_workers: int = 1,
+    checkpoint_path: Optional[Path] = CHECKPOINT_PATH,
+    tracer: Optional[Tracer] = None,
+    dedup_mode: str = dedup.DEDUP_MODE,
+    max_pending: Optional[int] = None,
+    numbered: bool = False,
+) -> Iterator[Dict[str, str]]:
+    """
+    Runs the agent over questions (any iterable, e.g. iter_questions(path)) on a pool
+    of max_workers threads and yields {"output": ...} for each question in input order.
+    With numbered=True, questions yields (index, question) pairs instead, index being
+    the question's position in the full input (a shard's subset, say); checkpoint
+    records, traces and error messages use that index.
 
-    return answers
+    Questions are pulled lazily: at most max_pending (default 4 x max_workers) are read
+    ahead of the last answer yielded, so the questions and answers are never all in
+    memory and the first question starts as soon as it has been read. Some state still
+    grows with the input: the dedup index (a 16-byte digest per question with "exact",
+    shingle fingerprints with "near"), the solved records later duplicates may copy,
+    and the resumed checkpoint (entries are dropped as they are used). With
+    dedup_mode="off" and no checkpoint to resume, memory stays flat.
+
+    Every solved question is appended to checkpoint_path as soon as it finishes,
+    and questions already present there are skipped, so a crashed run can simply
+    be restarted. Records of failed questions, and records whose input_hash doesn't
+    match the question now at that index (an edited or reordered input), are ignored
+    and the question is solved again. Pass checkpoint_path=None to disable checkpointing.
+    With a tracer, each question's stage and LLM-call spans are recorded.
+
+    Repeated and near-identical questions (see dedup.py, dedup_mode "off" /
+    "exact" / "near") are solved once; the answer is copied to every duplicate
+    and checkpointed under its index with "duplicate_of" set.
+    """
+    max_pending = max_pending or 4 * max(1, max_workers)
+    done: Dict[int, Dict[str, Any]] = {}
+    if checkpoint_path is not None:
+        done = load_checkpoint(checkpoint_path)
+        if done:
+            print(f"Resuming: {len(done)} questions already answered in {checkpoint_path}", flush=True)
+
+    # below, pos is the position in this stream (ordering, dedup) and qid the question's index
+    index = dedup.DuplicateIndex(dedup_mode)
+    # answered but not yielded yet (out of order), by pos
+    ready: Dict[int, str] = {}
+    # records of solved questions that later duplicates copy, by pos; only kept when deduplicating
+    solved: Dict[int, Dict[str, Any]] = {}
+    # canonical pos -> [(duplicate pos, its qid, its input_hash)]
+    waiting: Dict[int, List[Tuple[int, int, str]]] = defaultdict(list)
+    in_flight: Dict[Future, int] = {}
+    next_out = 0
+    finished = 0
+    stale = 0
+
+    checkpoint_fp = open_checkpoint(checkpoint_path) if checkpoint_path is not None else None
+
+    def write(pos: int, result: Dict[str, Any]) -> None:
+        nonlocal finished
+        ready[pos] = result["output"]
+        if checkpoint_fp is not None:
+            checkpoint_fp.write(json.dumps(result, ensure_ascii=False) + "\n")
+            checkpoint_fp.flush()
+        finished += 1
+        if finished % 10 == 0:
+            print(f"[{finished}] Solved questions...", flush=True)
+
+    def copy(pos: int, qid: int, input_hash: str, original: Dict[str, Any]) -> None:
+        # nothing was spent on the copy; the calls are counted on the original question
+        copied = dict(original, index=qid, input_hash=input_hash, duplicate_of=original["index"],
+                      latency=0.0, calls=0, cached_calls=0, llm_latency=0.0)
+        copied.pop("replay_misses", None)
+        write(pos, copied)
+
+    def complete(pos: int, result: Dict[str, Any]) -> None:
+        write(pos, result)
+        if dedup_mode != "off":
+            solved[pos] = result
+        for dup_pos, dup_qid, dup_hash in waiting.pop(pos, []):
+            copy(dup_pos, dup_qid, dup_hash, result)
+
+    def drain(block: bool) -> Iterator[Dict[str, str]]:
+        nonlocal next_out
+        if block and in_flight:
+            wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in [f for f in in_flight if f.done()]:
+            complete(in_flight.pop(future), future.result())
+        while next_out in ready:
+            yield {"output": ready.pop(next_out)}
+            next_out += 1
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        for pos, item in enumerate(questions):
+            qid, question = item if numbered else (pos, item)
+            canonical = index.add(question.get("input", ""))
+            record = done.pop(qid, None)
+            if record is not None and record.get("input_hash") != question_hash(question):
+                stale += 1
+                record = None
+            if record is not None:
+                ready[pos] = record["output"]
+                if canonical == pos and dedup_mode != "off":
+                    solved[pos] = record
+            elif canonical != pos:
+                if canonical in solved:
+                    copy(pos, qid, question_hash(question), solved[canonical])
+                else:
+                    waiting[canonical].append((pos, qid, question_hash(question)))
+            else:
+                in_flight[pool.submit(solve_question, qid, question, tracer)] = pos
+
+            yield from drain(block=False)
+            # bounded read-ahead: wait for answers before reading further
+            while pos + 1 - next_out >= max_pending and in_flight:
+                yield from drain(block=True)
+
+        while in_flight:
+            yield from drain(block=True)
+        yield from drain(block=False)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if checkpoint_fp is not None:
+            checkpoint_fp.close()
+
+    if stale:
+        print(f"Ignored {stale} checkpoint records whose question no longer matches the input", flush=True)
+    if index.groups.unique < len(index.groups.canonical):
+        print(index.groups.format_report(), flush=True)
+
+
+def build_answers(
+    questions: List[Dict[str, Any]],
+    max_workers: int = 1,
+    checkpoint_path: Optional[Path] = CHECKPOINT_PATH,
+    tracer: Optional[Tracer] = None,
+    dedup_mode: str = dedup.DEDUP_MODE,
+) -> List[Dict[str, str]]:
+    """Runs the agent over every question and returns the answers in input order (see stream_answers)."""
+    return list(stream_answers(questions, max_workers=max_workers, checkpoint_path=checkpoint_path,
+                               tracer=tracer, dedup_mode=dedup_mode))
+
+
+def validate_answer(idx: int, answer: Dict[str, Any]) -> None:
+    if "output" not in answer:
+        raise ValueError(f"Missing 'output' field for answer index {idx}.")
+    if not isinstance(answer["output"], str):
+        raise TypeError(
+            f"Answer at index {idx} has non-string output: {type(answer['output'])}"
+        )
+    if len(answer["output"]) >= 5000:
+        raise ValueError(
+            f"Answer at index {idx} exceeds 5000 characters "
+            f"({len(answer['output'])} chars). Please make sure your answer does not include any intermediate results."
+        )
 
 
 def validate_results(
-    questions: List[Dict[str, Any]], answers: List[Dict[str, Any]]
+    questions: Iterable[Dict[str, Any]], answers: Iterable[Dict[str, Any]]
 ) -> None:
-    if len(questions) != len(answers):
+    """Checks answers against questions; both may be iterators (e.g. iter_json_records), read once."""
+    num_questions = num_answers = 0
+    for idx, (question, answer) in enumerate(zip_longest(questions, answers, fillvalue=_MISSING)):
+        if question is not _MISSING:
+            num_questions += 1
+        if answer is not _MISSING:
+            num_answers += 1
+            validate_answer(idx, answer)
+    if num_questions != num_answers:
         raise ValueError(
-            f"Mismatched lengths: {len(questions)} questions vs {len(answers)} answers."
+            f"Mismatched lengths: {num_questions} questions vs {num_answers} answers."
         )
-    for idx, answer in enumerate(answers):
-        if "output" not in answer:
-            raise ValueError(f"Missing 'output' field for answer index {idx}.")
-        if not isinstance(answer["output"], str):
-            raise TypeError(
-                f"Answer at index {idx} has non-string output: {type(answer['output'])}"
-            )
-        if len(answer["output"]) >= 5000:
-            raise ValueError(
-                f"Answer at index {idx} exceeds 5000 characters "
-                f"({len(answer['output'])} chars). Please make sure your answer does not include any intermediate results."
-            )
+
+
+#===========================================================================
+# Sharded runs: --shard i/N solves the questions whose dedup.group_key
+# hashes to shard i (so repeats and near duplicates land in the same shard
+# and are still solved once) and writes {"index", "output"} records in input
+# order to its own partial file. --merge N reassembles the partial files in
+# order, and --processes N runs N shards as local subprocesses and merges
+# them. Shards only share the filesystem, so they can run on other machines.
+#===========================================================================
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """'2/8' -> (2, 8); shards are numbered from 0."""
+    try:
+        shard, num_shards = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {spec!r}") from None
+    if not 0 <= shard < num_shards:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{num_shards - 1}, got {shard}")
+    return shard, num_shards
+
+
+def shard_of(question: Dict[str, Any], num_shards: int) -> int:
+    digest = hashlib.sha1(dedup.group_key(question.get("input", "")).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_path(path: Path, shard: int, num_shards: int) -> Path:
+    """cse_476_final_project_answers.json -> cse_476_final_project_answers.shard-2-of-8.jsonl"""
+    stem = path.stem if path.suffix in (".json", ".jsonl") else path.name
+    return path.with_name(f"{stem}.shard-{shard}-of-{num_shards}.jsonl")
+
+
+def run_shard(
+    shard: int,
+    num_shards: int,
+    input_path: Path = INPUT_PATH,
+    output_path: Path = OUTPUT_PATH,
+    max_workers: int = 1,
+    checkpoint_path: Optional[Path] = CHECKPOINT_PATH,
+    tracer: Optional[Tracer] = None,
+    dedup_mode: str = dedup.DEDUP_MODE,
+) -> Path:
+    """Solves one shard and returns its partial output file (renamed into place once complete)."""
+    partial = shard_path(output_path, shard, num_shards)
+    tmp = partial.with_name(partial.name + ".tmp")
+    indices: Deque[int] = deque()
+
+    def selected() -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for idx, question in enumerate(iter_questions(input_path)):
+            if shard_of(question, num_shards) == shard:
+                indices.append(idx)
+                yield idx, question
+
+    if checkpoint_path is not None:
+        checkpoint_path = shard_path(checkpoint_path, shard, num_shards)
+    # answers come back in the order the questions were handed out, so they pair up with indices
+    with tmp.open("w", encoding="utf-8") as fp:
+        for answer in stream_answers(selected(), max_workers=max_workers, checkpoint_path=checkpoint_path,
+                                     tracer=tracer, dedup_mode=dedup_mode, numbered=True):
+            fp.write(json.dumps({"index": indices.popleft(), "output": answer["output"]}, ensure_ascii=False) + "\n")
+    os.replace(tmp, partial)
+    return partial
+
+
+def merge_shards(num_shards: int, input_path: Path = INPUT_PATH, output_path: Path = OUTPUT_PATH) -> int:
+    """Merges the shard files into output_path in input order, validates it and returns the answer count."""
+    partials = [shard_path(output_path, shard, num_shards) for shard in range(num_shards)]
+    missing = [str(p) for p in partials if not p.exists()]
+    if missing:
+        raise FileNotFoundError(f"shard output not found (shard not finished?): {', '.join(missing)}")
+
+    def answers() -> Iterator[Dict[str, str]]:
+        # every shard file is sorted by index, so a k-way merge keeps memory flat
+        merged = heapq.merge(*(iter_json_records(p) for p in partials), key=lambda record: record["index"])
+        for expected, record in enumerate(merged):
+            if record["index"] != expected:
+                raise ValueError(f"shard outputs don't line up: expected question {expected}, found {record['index']}")
+            yield {"output": record["output"]}
+
+    with AnswerWriter(output_path) as writer:
+        for answer in answers():
+            writer.write(answer)
+    validate_results(iter_questions(input_path), iter_json_records(output_path))
+    return writer.count
+
+
+def run_local_shards(num_shards: int, args: argparse.Namespace) -> None:
+    """Runs --shard i/N for every i as a subprocess of this machine, then merges the results."""
+    procs = []
+    for shard in range(num_shards):
+        cmd = [sys.executable, os.path.abspath(__file__), "--shard", f"{shard}/{num_shards}",
+               "--workers", str(args.workers), "--dedup", args.dedup]
+        if args.no_resume:
+            cmd.append("--no-resume")
+        if args.no_cache:
+            cmd.append("--no-cache")
+        if args.trace:
+            cmd += ["--trace", str(shard_path(args.trace, shard, num_shards))]
+        if args.checkpoint != CHECKPOINT_PATH:
+            cmd += ["--checkpoint", str(args.checkpoint)]
+        # shards share the store (SQLite in WAL mode)
+        if args.record:
+            cmd += ["--record", str(args.record)]
+        if args.replay:
+            cmd += ["--replay", str(args.replay)]
+        procs.append(subprocess.Popen(cmd))
+    failed = [shard for shard, proc in enumerate(procs) if proc.wait() != 0]
+    if failed:
+        raise SystemExit(f"shards {failed} failed; rerun them with --shard i/{num_shards} (they resume) and then --merge {num_shards}")
+    count = merge_shards(num_shards)
+    print(f"Merged {num_shards} shards: wrote {count} answers to {OUTPUT_PATH} and validated format successfully.")
+
+
+def print_run_report(tracer: Optional[Tracer]) -> None:
+    cache = get_response_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
+    if tracer is not None:
+        print(tracer.format_summary())
+    store = get_call_store()
+    if store is not None:
+        print(store.format_report())
+    early = validators.STATS.as_dict()
+    print(f"Early exit: {early['accepted']}/{early['checked']} answers accepted by local validators, "
+          f"~{early['calls_saved']} LLM calls saved")
+    limits = agent.LIMITER.stats()
+    print(f"Endpoint: {limits['throttled']} throttled (429) responses, final concurrency limit {limits['limit']}")
+    print(routing.REPORT.format_report())
+    pool = agent.get_backend_pool()
+    if pool is not None:
+        backends = pool.stats()
+        print(f"Backends ({backends['strategy']}, {backends['failovers']} failovers):")
+        for b in backends["backends"]:
+            print(f"  {b['url']}: {b['requests']} requests, {b['errors']} errors, "
+                  f"ewma latency {b['ewma_latency_s']}s, {'up' if b['healthy'] else 'down'}")
 
 
 def main() -> None:
-    questions = load_questions(INPUT_PATH)
-    answers = build_answers(questions)
-
-    with OUTPUT_PATH.open("w", encoding="utf-8") as fp:
-        json.dump(answers, fp, ensure_ascii=False, indent=2)
-
-    with OUTPUT_PATH.open("r", encoding="utf-8") as fp:
-        saved_answers = json.load(fp)
-    validate_results(questions, saved_answers)
-    print(
-        f"Wrote {len(answers)} answers to {OUTPUT_PATH} "
-        "and validated format successfully."
+    parser = argparse.ArgumentParser(description="Run the agent over the test questions.")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of questions solved concurrently (default: 1)",
     )
+    parser.add_argument(
+        "--no-resume", action="store_true",
+        help="ignore and overwrite an existing checkpoint",
+    )
+    parser.add_argument(
+        "--checkpoint", type=Path, default=CHECKPOINT_PATH, metavar="PATH",
+        help="per-question JSONL checkpoint, also the run log --diff compares (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--trace", type=Path, metavar="PATH",
+        help="write per-question stage/LLM-call spans to PATH (JSONL) and print a summary by domain",
+    )
+    parser.add_argument(
+        "--dedup", choices=dedup.MODES, default=dedup.DEDUP_MODE,
+        help="solve repeated (exact) or also near-identical (near) questions once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="bypass the on-disk LLM response cache",
+    )
+    calls = parser.add_mutually_exclusive_group()
+    calls.add_argument(
+        "--record", type=Path, metavar="PATH",
+        help="record every LLM request/response to PATH (SQLite) for later --replay",
+    )
+    calls.add_argument(
+        "--replay", type=Path, metavar="PATH",
+        help="answer LLM calls from a --record store instead of the endpoint; unrecorded requests fail and are reported",
+    )
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument(
+        "--shard", type=parse_shard, metavar="i/N",
+        help="solve only shard i of N (0-based) and write it to a partial .shard-i-of-N.jsonl file",
+    )
+    modes.add_argument(
+        "--merge", type=int, metavar="N",
+        help=f"merge the N finished shard files into {OUTPUT_PATH} and validate it",
+    )
+    modes.add_argument(
+        "--processes", type=int, metavar="N",
+        help="run N shards as local processes (each with --workers threads), then merge them",
+    )
+    modes.add_argument(
+        "--diff", type=Path, nargs=2, metavar=("BASE", "NEW"),
+        help="compare two runs' checkpoints: changed outputs, calls and latency per domain",
+    )
+    args = parser.parse_args()
+
+    if args.diff:
+        base, new = (load_checkpoint(path, include_errors=True) for path in args.diff)
+        print(diff_runs(base, new).format_report())
+        return
+
+    if args.merge:
+        count = merge_shards(args.merge)
+        print(f"Merged {args.merge} shards: wrote {count} answers to {OUTPUT_PATH} and validated format successfully.")
+        return
+    if args.processes:
+        run_local_shards(args.processes, args)
+        return
+
+    if args.no_cache or args.replay:
+        set_response_cache(None)
+    if args.record or args.replay:
+        set_call_store(CallStore(args.record or args.replay, "record" if args.record else "replay"))
+
+    checkpoint_path = shard_path(args.checkpoint, *args.shard) if args.shard else args.checkpoint
+    if args.no_resume and checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+    tracer = Tracer(args.trace) if args.trace else None
+    try:
+        if args.shard:
+            partial = run_shard(*args.shard, max_workers=args.workers, checkpoint_path=args.checkpoint,
+                                tracer=tracer, dedup_mode=args.dedup)
+            print(f"Shard {args.shard[0]}/{args.shard[1]} done: answers written to {partial}")
+        else:
+            with AnswerWriter(OUTPUT_PATH) as writer:
+                for answer in stream_answers(iter_questions(INPUT_PATH), max_workers=args.workers,
+                                             checkpoint_path=checkpoint_path, tracer=tracer,
+                                             dedup_mode=args.dedup):
+                    writer.write(answer)
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+    if not args.shard:
+        # streamed: neither file is loaded whole
+        validate_results(iter_questions(INPUT_PATH), iter_json_records(OUTPUT_PATH))
+        print(
+            f"Wrote {writer.count} answers to {OUTPUT_PATH} "
+            "and validated format successfully."
+        )
+    print_run_report(tracer)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,146 @@
+"""
+On-disk response cache for chat completion calls.
+
+Responses are stored in a SQLite file and keyed on a hash of everything that
+changes the completion (model, system prompt, user prompt, temperature,
+max_tokens and a sample index so repeated stochastic samples don't collapse
+into one). The cache is bounded by entry count and evicts the least recently
+used entries first. Only deterministic calls are cached unless
+LLM_CACHE_SAMPLED=1 (see agent.call_model_chat_completions).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200000"))
+# set LLM_CACHE=0 to bypass the cache for every call
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+# sampled (temperature > 0) calls are only cached with LLM_CACHE_SAMPLED=1, so reruns draw fresh votes
+CACHE_SAMPLED = os.getenv("LLM_CACHE_SAMPLED", "0") == "1"
+
+
+def make_cache_key(model: str, system: str, prompt: str, temperature: float,
+                   max_tokens: int, sample: int = 0, **extra: Any) -> str:
+    fields = {
+        "model": model,
+        "system": system,
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "sample": sample,
+    }
+    fields.update(extra)
+    blob = json.dumps(fields, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        # WAL lets several processes (shards) share the same cache file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        blob = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO responses (key, response, last_used) VALUES (?, ?, ?)",
+                (key, blob, time.time()),
+            )
+            if cur.rowcount == 0:
+                self._conn.execute(
+                    "UPDATE responses SET response = ?, last_used = ? WHERE key = ?",
+                    (blob, time.time(), key),
+                )
+            else:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, n: int) -> None:
+        cur = self._conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+            (n,),
+        )
+        self._count -= cur.rowcount
+        self.evictions += cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Returns the shared cache, or None when caching is disabled."""
+    global _default_cache
+    if not CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ResponseCache()
+    return _default_cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+    global _default_cache, CACHE_ENABLED
+    with _default_lock:
+        _default_cache = cache
+        CACHE_ENABLED = cache is not None
@@ -0,0 +1,394 @@
+"""
+Local fake OpenAI-compatible /v1/chat/completions server for offline benchmarks.
+
+    server = MockChatServer(latency=LatencyModel("lognormal", mean=0.2), error_rate=0.05)
+    server.start()
+    agent.API_BASE = server.url
+    ...
+    server.stop()
+
+Replies follow the one-line protocol the agent expects: the first prompt may
+get a "CALCULATE: <expr>" for arithmetic questions, everything else gets a
+"FINAL: <answer>" (verifier / CoT prompts echo the proposed answer back).
+Scripted responses can override this per prompt pattern. When a request
+offers tools, CALCULATE replies come back as a native "calculate" tool call
+and a conversation ending in a tool result is answered with FINAL.
+
+With prefill_seconds_per_token > 0 the server also models prompt prefill
+with a vLLM-style prefix cache: prompts are hashed in blocks of
+PREFIX_BLOCK_TOKENS tokens, and only tokens after the longest already-seen
+prefix cost prefill time. This makes time-to-first-token sensitive to
+prompt layout the same way a real serving backend is.
+
+decode_seconds_per_token charges decode time per completion token, and
+ramble_tokens appends that many words of explanation after each reply, the
+way chatty models keep going past the action line. Requests with
+"stream": true are answered as server-sent events, one token per event; a
+client that disconnects mid-stream stops the decode (aborted_streams).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+Responder = Union[str, Callable[[str, str], str]]
+
+PREFIX_BLOCK_TOKENS = 16
+PREFIX_CACHE_BLOCKS = 100_000
+
+
+@dataclass
+class LatencyModel:
+    """Per-request server delay in seconds: fixed, uniform(low, high) or lognormal(mean, sigma)."""
+    kind: str = "fixed"
+    mean: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+    sigma: float = 0.5
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.mean
+        if self.kind == "uniform":
+            return rng.uniform(self.low, self.high)
+        if self.kind == "lognormal":
+            if self.mean <= 0:
+                return 0.0
+            # parameterised so the distribution's mean is self.mean
+            mu = math.log(self.mean) - self.sigma ** 2 / 2
+            return rng.lognormvariate(mu, self.sigma)
+        raise ValueError(f"Unknown latency model: {self.kind!r}")
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    errors: int = 0
+    choices: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    streams: int = 0
+    aborted_streams: int = 0
+    # summed simulated time-to-first-token (latency + prefill) of successful requests
+    ttft_seconds: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        with self.lock:
+            ok = self.requests - self.errors
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "choices": self.choices,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "streams": self.streams,
+                "aborted_streams": self.aborted_streams,
+                "mean_ttft_s": round(self.ttft_seconds / ok, 4) if ok else 0.0,
+            }
+
+
+class PrefixCache:
+    """Block-hashed prompt prefix cache (like vLLM's automatic prefix caching)."""
+
+    def __init__(self, block_tokens: int = PREFIX_BLOCK_TOKENS, max_blocks: int = PREFIX_CACHE_BLOCKS):
+        self.block_tokens = block_tokens
+        self.max_blocks = max_blocks
+        self._blocks: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_and_insert(self, tokens: List[str]) -> int:
+        """Returns how many leading tokens were already cached, and caches all full blocks."""
+        cached = 0
+        digest = hashlib.sha1()
+        still_hitting = True
+        with self._lock:
+            for start in range(0, len(tokens) - self.block_tokens + 1, self.block_tokens):
+                digest.update(" ".join(tokens[start:start + self.block_tokens]).encode("utf-8"))
+                key = digest.hexdigest()
+                if still_hitting and key in self._blocks:
+                    cached += self.block_tokens
+                    self._blocks.move_to_end(key)
+                    continue
+                still_hitting = False
+                self._blocks[key] = None
+                if len(self._blocks) > self.max_blocks:
+                    self._blocks.popitem(last=False)
+        return cached
+
+
+_PROPOSED_RE = re.compile(r"(?:Proposed|Previous) Final Answer:\s*\n(.*)\s*$", re.DOTALL)
+_TASK_RE = re.compile(r"Task:\s*\n(.*?)(?:\n\s*\n|$)", re.DOTALL)
+_CALC_RESULT_RE = re.compile(r"CALCULATE tool results:\s*\n(.*?)(?:\n|$)", re.DOTALL)
+_ARITH_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([-+*/])\s*(\d+(?:\.\d+)?)")
+
+
+_RAMBLE_WORDS = "This follows from working through the question step by step as shown above .".split()
+
+
+def _count_tokens(text: str) -> int:
+    # rough whitespace token count, good enough for relative comparisons
+    return len(text.split())
+
+
+def _prompt_tokens(messages: List[dict]) -> List[str]:
+    """Whitespace tokens of the whole conversation, with role markers, in request order."""
+    tokens = []
+    for m in messages:
+        tokens.append(f"<|{m.get('role', '')}|>")
+        tokens.extend((m.get("content") or "").split())
+    return tokens
+
+
+def default_responder(system: str, prompt: str) -> str:
+    """Protocol-shaped replies that exercise the agent's normal code paths."""
+    proposed = _PROPOSED_RE.search(prompt)
+    if proposed:
+        return f"FINAL: {proposed.group(1).strip()}"
+
+    calc_result = _CALC_RESULT_RE.search(prompt)
+    if calc_result:
+        return f"FINAL: {calc_result.group(1).strip()}"
+
+    task = _TASK_RE.search(prompt)
+    question = task.group(1) if task else prompt
+    arith = _ARITH_RE.search(question)
+    if arith and "Global Output Guidelines" in prompt:
+        return f"CALCULATE: {arith.group(1)} {arith.group(2)} {arith.group(3)}"
+    lowered = question.lower()
+    if "yes or no" in lowered:
+        return "FINAL: YES"
+    if "[plan]" in lowered:
+        return "FINAL: (pick-up a)\n(stack a b)"
+    if "python" in lowered or "function" in lowered:
+        return "FINAL: def solve(x):\n    return x"
+    digest = hashlib.sha1(question.encode("utf-8")).hexdigest()
+    return f"FINAL: {int(digest[:6], 16) % 1000}"
+
+
+class MockChatServer:
+    def __init__(self, latency: Optional[LatencyModel] = None, error_rate: float = 0.0,
+                 error_status: int = 503, retry_after: Optional[float] = None,
+                 scripted: Optional[List[Tuple[str, Responder]]] = None,
+                 seed: int = 0, host: str = "127.0.0.1", port: int = 0,
+                 supports_tools: bool = True, prefill_seconds_per_token: float = 0.0,
+                 prefix_cache_blocks: int = PREFIX_CACHE_BLOCKS, decode_seconds_per_token: float = 0.0,
+                 ramble_tokens: int = 0, model_latency: Optional[Dict[str, float]] = None):
+        """
+        scripted: list of (regex, response) checked against the user prompt in order; the
+        response is a string or a callable (system, prompt) -> str. Unmatched prompts use
+        default_responder. error_rate of requests fail with error_status (plus Retry-After
+        when retry_after is set). With supports_tools=False, requests carrying tools get a 400.
+        prefill_seconds_per_token adds simulated prefill time for prompt tokens not covered
+        by the prefix cache; prefix_cache_blocks=0 disables the cache. decode_seconds_per_token
+        and ramble_tokens model decode time and replies that run on past their first line.
+        model_latency maps a model name to a factor on its latency and decode time (e.g. a
+        small model at 0.3).
+        """
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.supports_tools = supports_tools
+        self.prefill_seconds_per_token = prefill_seconds_per_token
+        self.prefix_cache = PrefixCache(max_blocks=prefix_cache_blocks)
+        self.decode_seconds_per_token = decode_seconds_per_token
+        self.ramble_tokens = ramble_tokens
+        self.model_latency = model_latency or {}
+        self.scripted = [(re.compile(pattern, re.DOTALL), response) for pattern, response in (scripted or [])]
+        self.stats = MockStats()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockChatServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockChatServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def respond(self, system: str, prompt: str) -> str:
+        for pattern, response in self.scripted:
+            if pattern.search(prompt):
+                return response(system, prompt) if callable(response) else response
+        text = default_responder(system, prompt)
+        if self.ramble_tokens:
+            text += "\n" + " ".join(_RAMBLE_WORDS[i % len(_RAMBLE_WORDS)] for i in range(self.ramble_tokens))
+        return text
+
+    def _draw(self) -> Tuple[float, bool]:
+        with self._rng_lock:
+            return self.latency.sample(self._rng), self._rng.random() < self.error_rate
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # health check endpoint
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, fail = mock._draw()
+                speed = mock.model_latency.get(body.get("model"), 1.0)
+                delay *= speed
+                if delay > 0:
+                    time.sleep(delay)
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+                    return
+                if fail:
+                    with mock.stats.lock:
+                        mock.stats.requests += 1
+                        mock.stats.errors += 1
+                    headers = {"Retry-After": str(mock.retry_after)} if mock.retry_after is not None else None
+                    self._send_json(mock.error_status, {"error": "injected failure"}, headers)
+                    return
+
+                tools = body.get("tools")
+                if tools and not mock.supports_tools:
+                    self._send_json(400, {"error": "tools are not supported"})
+                    return
+
+                messages = body.get("messages", [])
+                system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+                prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+                n = int(body.get("n", 1))
+                if messages and messages[-1].get("role") == "tool":
+                    text = f"FINAL: {messages[-1].get('content', '')}"
+                else:
+                    text = mock.respond(system, prompt)
+                tool_calls = None
+                if tools and body.get("tool_choice") != "none" and text.startswith("CALCULATE:"):
+                    expression = text.split("\n", 1)[0].split(":", 1)[1].strip()
+                    tool_calls = [{
+                        "id": f"call_{mock.stats.requests}",
+                        "type": "function",
+                        "function": {"name": "calculate", "arguments": json.dumps({"expression": expression})},
+                    }]
+                tokens = _prompt_tokens(messages)
+                prompt_tokens = len(tokens)
+                cached_tokens = mock.prefix_cache.lookup_and_insert(tokens)
+                prefill = (prompt_tokens - cached_tokens) * mock.prefill_seconds_per_token
+                if prefill > 0:
+                    time.sleep(prefill)
+                usage = {"prompt_tokens": prompt_tokens, "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+                if body.get("stream") and not tool_calls:
+                    completion_tokens = self._stream(body, text, usage, mock.decode_seconds_per_token * speed)
+                    n = 1
+                else:
+                    completion_tokens = _count_tokens(text) * n
+                    # the n choices are decoded in parallel
+                    decode = _count_tokens(text) * mock.decode_seconds_per_token * speed
+                    if decode > 0:
+                        time.sleep(decode)
+                with mock.stats.lock:
+                    mock.stats.requests += 1
+                    mock.stats.choices += n
+                    mock.stats.prompt_tokens += prompt_tokens
+                    mock.stats.cached_prompt_tokens += cached_tokens
+                    mock.stats.completion_tokens += completion_tokens
+                    mock.stats.ttft_seconds += delay + prefill
+                if body.get("stream") and not tool_calls:
+                    return
+                self._send_json(200, {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "model": body.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": i,
+                            "message": {"role": "assistant", "content": None, "tool_calls": tool_calls}
+                            if tool_calls else {"role": "assistant", "content": text},
+                            "finish_reason": "tool_calls" if tool_calls else "stop",
+                        }
+                        for i in range(n)
+                    ],
+                    "usage": dict(usage, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+                })
+
+            def _stream(self, body: dict, text: str, usage: dict, seconds_per_token: float) -> int:
+                """Sends text as SSE chunks; returns the number of tokens decoded before the client left."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+
+                def event(payload) -> None:
+                    data = payload if isinstance(payload, str) else json.dumps(payload)
+                    self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                def chunk(delta: dict, finish_reason=None, **extra) -> dict:
+                    return dict({"id": "mock", "object": "chat.completion.chunk", "model": body.get("model", "mock"),
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}, **extra)
+
+                pieces = re.findall(r"\s*\S+", text)
+                sent = 0
+                try:
+                    event(chunk({"role": "assistant", "content": ""}))
+                    for piece in pieces:
+                        if seconds_per_token > 0:
+                            time.sleep(seconds_per_token)
+                        event(chunk({"content": piece}))
+                        sent += 1
+                    event(chunk({}, "stop", usage=dict(usage, completion_tokens=sent,
+                                                         total_tokens=usage["prompt_tokens"] + sent)))
+                    event("[DONE]")
+                except (BrokenPipeError, ConnectionResetError):
+                    with mock.stats.lock:
+                        mock.stats.aborted_streams += 1
+                with mock.stats.lock:
+                    mock.stats.streams += 1
+                return sent
+
+        return Handler
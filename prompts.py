@@ -0,0 +1,30 @@
+"""
+Prompt assembly with a static prefix.
+
+Serving backends with prefix caching (vLLM and similar) only reuse the KV
+cache for the leading tokens that are identical between requests. Every
+prompt is therefore laid out as system message + static instructions first
+and the per-question content last; PromptPrefix holds the static part so it
+is built once per domain and shared by every question.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    system: str
+    prefix: str
+
+    def render(self, *parts: str) -> str:
+        """User message: the static prefix followed by the per-question parts."""
+        return self.prefix + "".join(parts)
+
+    def messages(self, *parts: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user",   "content": self.render(*parts)},
+        ]
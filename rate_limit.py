@@ -0,0 +1,126 @@
+"""
+Retry and concurrency control for calls to the shared model endpoint.
+
+RetryPolicy decides which failures are worth retrying and how long to wait
+(jittered exponential backoff, or the server's Retry-After when it sends one).
+AIMDLimiter caps the number of in-flight requests: the cap grows by one after
+a run of successes and is halved when the server answers 429, so throughput
+settles at whatever the server can sustain.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# -1 is what call_model_chat_completions reports for timeouts / connection errors
+RETRY_STATUSES = frozenset({-1, 408, 409, 425, 429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header (seconds or HTTP date) into seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0,
+                 retry_statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def should_retry(self, status: int, attempt: int) -> bool:
+        return attempt < self.max_retries and status in self.retry_statuses
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to sleep before retry number attempt + 1 (attempt is 0-based)."""
+        server_delay = parse_retry_after(retry_after)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        # "full jitter": uniform in [0, base * 2^attempt] so retries from many workers spread out
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease cap on concurrent requests.
+
+        with limiter.slot() as slot:
+            result = do_request()
+            slot.report(result["status"])
+    """
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 increase_every: int = 10, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_every = increase_every
+        # many in-flight requests see the same overload; only back off once per cooldown window
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.throttled = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, status: int) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if status == 429:
+                self.throttled += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                self._successes = 0
+            elif status == 200:
+                self._successes += 1
+                if self._successes >= self.increase_every:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self._successes = 0
+            self._cond.notify_all()
+
+    def slot(self) -> "_Slot":
+        return _Slot(self)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, "throttled": self.throttled}
+
+
+class _Slot:
+    def __init__(self, limiter: AIMDLimiter):
+        self.limiter = limiter
+        self.status = -1
+
+    def report(self, status: int) -> None:
+        self.status = status
+
+    def __enter__(self) -> "_Slot":
+        self.limiter.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.limiter.release(self.status)
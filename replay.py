@@ -0,0 +1,235 @@
+"""
+Record / replay of chat completion calls, for re-running the agent offline.
+
+In record mode every successful call_model_chat_completions is stored in a
+SQLite file under the request key the response cache uses (model,
+messages, temperature, max_tokens, sample, ...), together with its latency,
+time to first token and whether it was a cache hit. Whether the call was
+streamed is left out of the key: streaming may be switched off partway
+through a run (a backend that rejects it), and replay must not depend on
+when. Only the key hash is kept, not the prompt, so the store stays small.
+
+In replay mode calls are answered from the store and never reach the
+network. A request that was not recorded (a changed prompt, a new vote) is
+a miss: it fails the same way every time,
+is counted on the question (the "replay_misses" checkpoint field) and is
+listed in the end-of-run report. Replayed calls report their recorded
+latency, so "llm_latency" stays comparable with the recorded run.
+
+    python generate_answer_template.py --no-cache --record calls.sqlite --checkpoint base.jsonl
+    # edit prompts / voting
+    python generate_answer_template.py --replay calls.sqlite --checkpoint new.jsonl --no-resume
+    python generate_answer_template.py --diff base.jsonl new.jsonl
+
+diff_runs compares two such checkpoint files: changed outputs, calls and
+latency overall and per domain.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from tracing import percentile
+
+MODES = ("record", "replay")
+# LLM_RECORD=calls.sqlite or LLM_REPLAY=calls.sqlite turn the mode on without the CLI flags
+RECORD_PATH = os.getenv("LLM_RECORD", "")
+REPLAY_PATH = os.getenv("LLM_REPLAY", "")
+
+# misses listed in the report
+MISS_SAMPLES = 5
+
+
+class CallStore:
+    def __init__(self, path: Path, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown call store mode: {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        if mode == "replay" and not self.path.exists():
+            raise FileNotFoundError(f"no recorded calls at {self.path}")
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.miss_samples: List[str] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        # WAL lets several processes (shards) record into the same file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " latency REAL NOT NULL,"
+            " ttft REAL,"
+            " cached INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, key: str, result: Dict[str, Any]) -> None:
+        blob = json.dumps(result["raw"], ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            # a later recording of the same request replaces the earlier one
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calls (key, response, latency, ttft, cached) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, result.get("latency") or 0.0, result.get("ttft"), int(bool(result.get("cached")))),
+            )
+            self._conn.commit()
+            self.recorded += 1
+
+    def lookup(self, key: str, label: str = "") -> Optional[Dict[str, Any]]:
+        """The recorded {"raw", "latency", "ttft", "cached"} for key, or None (a miss, described by label)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency, ttft, cached FROM calls WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                if len(self.miss_samples) < MISS_SAMPLES:
+                    self.miss_samples.append(label)
+                return None
+            self.replayed += 1
+        return {"raw": json.loads(row[0]), "latency": row[1], "ttft": row[2], "cached": bool(row[3])}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "path": str(self.path), "recorded": self.recorded,
+                    "replayed": self.replayed, "misses": self.misses, "miss_samples": list(self.miss_samples)}
+
+    def format_report(self) -> str:
+        stats = self.stats()
+        if self.mode == "record":
+            return f"Recorded {stats['recorded']} calls to {stats['path']}"
+        lines = [f"Replay: {stats['replayed']} calls served from {stats['path']}, {stats['misses']} misses"]
+        lines += [f"  miss: {sample}" for sample in stats["miss_samples"]]
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[CallStore] = None
+_default_lock = threading.Lock()
+_configured = False
+
+
+def get_call_store() -> Optional[CallStore]:
+    """The active store (from set_call_store or LLM_RECORD / LLM_REPLAY), or None."""
+    global _default_store, _configured
+    if not _configured:
+        with _default_lock:
+            if not _configured:
+                if REPLAY_PATH:
+                    _default_store = CallStore(Path(REPLAY_PATH), "replay")
+                elif RECORD_PATH:
+                    _default_store = CallStore(Path(RECORD_PATH), "record")
+                _configured = True
+    return _default_store
+
+
+def set_call_store(store: Optional[CallStore]) -> None:
+    global _default_store, _configured
+    with _default_lock:
+        _default_store = store
+        _configured = True
+
+
+#===========================================================================
+# Run diff: two runs' checkpoint records ({index: record}, see
+# generate_answer_template.load_checkpoint) compared question by question
+#===========================================================================
+
+@dataclass
+class RunDiff:
+    compared: int = 0
+    only_base: int = 0
+    only_new: int = 0
+    # (index, domain, base output, new output)
+    changed: List[Tuple[int, str, str, str]] = field(default_factory=list)
+    # {domain or "all": {"base"/"new": {"calls", "cached_calls", "latency", "llm_latency", ...}}}
+    totals: Dict[str, Dict[str, Dict[str, float]]] = field(default_factory=dict)
+    replay_misses: int = 0
+    # changed questions whose new answer was produced with replay misses
+    changed_with_misses: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"compared": self.compared, "only_base": self.only_base, "only_new": self.only_new,
+                "changed": len(self.changed), "replay_misses": self.replay_misses,
+                "changed_with_misses": self.changed_with_misses, "totals": self.totals}
+
+    def format_report(self, max_changes: int = 10) -> str:
+        lines = [f"Run diff: {self.compared} questions compared, {len(self.changed)} outputs changed"
+                 + (f" ({self.changed_with_misses} of them with replay misses)" if self.changed_with_misses else "")]
+        if self.only_base or self.only_new:
+            lines.append(f"  {self.only_base} questions only in base, {self.only_new} only in new")
+        if self.replay_misses:
+            lines.append(f"  {self.replay_misses} replay misses in new")
+        for domain, sides in sorted(self.totals.items(), key=lambda item: item[0] != "all"):
+            base, new = sides["base"], sides["new"]
+            lines.append(
+                f"  {domain}: calls {base['calls']} -> {new['calls']} ({_delta(base['calls'], new['calls'])}), "
+                f"llm seconds {base['llm_latency']:.2f} -> {new['llm_latency']:.2f} "
+                f"({_delta(base['llm_latency'], new['llm_latency'])}), "
+                f"p50/p95 latency {base['p50_latency']:.3f}/{base['p95_latency']:.3f}s -> "
+                f"{new['p50_latency']:.3f}/{new['p95_latency']:.3f}s"
+            )
+        for idx, domain, before, after in self.changed[:max_changes]:
+            lines.append(f"  [{idx}] {domain}: {_clip(before)!r} -> {_clip(after)!r}")
+        if len(self.changed) > max_changes:
+            lines.append(f"  ... {len(self.changed) - max_changes} more")
+        return "\n".join(lines)
+
+
+def _delta(before: float, after: float) -> str:
+    return f"{(after - before) / before:+.1%}" if before else "n/a"
+
+
+def _clip(text: str, width: int = 60) -> str:
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def _side_totals(records: List[Dict[str, Any]]) -> Dict[str, float]:
+    # duplicate copies cost nothing and would drag the percentiles to zero
+    latencies = [r.get("latency", 0.0) for r in records if "duplicate_of" not in r]
+    return {
+        "calls": sum(r.get("calls", 0) for r in records),
+        "cached_calls": sum(r.get("cached_calls", 0) for r in records),
+        "latency": round(sum(latencies), 3),
+        "llm_latency": round(sum(r.get("llm_latency", 0.0) for r in records), 3),
+        "p50_latency": percentile(latencies, 50),
+        "p95_latency": percentile(latencies, 95),
+    }
+
+
+def diff_runs(base: Dict[int, Dict[str, Any]], new: Dict[int, Dict[str, Any]]) -> RunDiff:
+    common = sorted(base.keys() & new.keys())
+    diff = RunDiff(compared=len(common), only_base=len(base.keys() - new.keys()),
+                   only_new=len(new.keys() - base.keys()))
+    by_domain: Dict[str, List[int]] = defaultdict(list)
+    for idx in common:
+        b, n = base[idx], new[idx]
+        domain = n.get("domain") or b.get("domain") or "unknown"
+        by_domain["all"].append(idx)
+        by_domain[domain].append(idx)
+        diff.replay_misses += n.get("replay_misses", 0)
+        if b["output"] != n["output"]:
+            diff.changed.append((idx, domain, b["output"], n["output"]))
+            # a duplicate inherits the misses of the question it copies
+            if n.get("replay_misses") or new.get(n.get("duplicate_of"), {}).get("replay_misses"):
+                diff.changed_with_misses += 1
+    for domain, indices in by_domain.items():
+        diff.totals[domain] = {"base": _side_totals([base[i] for i in indices]),
+                               "new": _side_totals([new[i] for i in indices])}
+    return diff
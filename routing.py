@@ -0,0 +1,139 @@
+"""
+Domain-aware model and token-budget routing.
+
+Each domain from classify_domain gets a RoutePolicy: which model answers the
+first prompt, how many tokens it may spend, how many CoT votes to take and
+where to escalate when the cheap path looks doubtful:
+
+  * CoT votes that split without a majority get escalate_samples more votes
+    from strong_model;
+  * an answer the local validators reject is verified by strong_model.
+
+Common sense and future prediction go to small_model with a lower budget
+when one is configured (otherwise they keep the base model and budget);
+math, planning and coding stay on the base model.
+
+UsageReport (REPORT) tallies calls, tokens, latency and estimated cost per
+model plus escalations per domain, so a run can be compared against another
+routing setup:
+
+    print(routing.REPORT.format_report())
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+DEFAULT_DOMAIN = "default"
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    model: str
+    max_tokens: int = 128
+    cot_samples: int = 3
+    strong_model: Optional[str] = None
+    escalate_samples: int = 0
+
+    @property
+    def escalation_model(self) -> str:
+        return self.strong_model or self.model
+
+
+def build_policies(base_model: str, small_model: Optional[str] = None,
+                   strong_model: Optional[str] = None) -> Dict[str, RoutePolicy]:
+    strong_model = strong_model or base_model
+    # the lower budget comes with the small model, not on its own
+    cheap = RoutePolicy(small_model or base_model, max_tokens=64 if small_model else 128,
+                        cot_samples=0, strong_model=strong_model)
+    return {
+        "common sense":      cheap,
+        "future prediction": cheap,
+        "math":              RoutePolicy(base_model, cot_samples=3, strong_model=strong_model, escalate_samples=2),
+        "planning":          RoutePolicy(base_model, cot_samples=3, strong_model=strong_model, escalate_samples=2),
+        "coding":            RoutePolicy(base_model, cot_samples=0, strong_model=strong_model),
+        DEFAULT_DOMAIN:      RoutePolicy(base_model, cot_samples=3, strong_model=strong_model),
+    }
+
+
+def uniform_policies(base_model: str) -> Dict[str, RoutePolicy]:
+    """Routing turned off: every domain on the base model with the original budget and votes."""
+    return {DEFAULT_DOMAIN: RoutePolicy(base_model, cot_samples=3)}
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """'small=0.1/0.4,big=0.5/1.5' -> {model: (input, output)} in dollars per million tokens."""
+    prices = {}
+    for item in spec.split(","):
+        model, sep, price = item.strip().rpartition("=")
+        if not sep:
+            continue
+        prompt_price, _, completion_price = price.partition("/")
+        try:
+            prices[model] = (float(prompt_price), float(completion_price or prompt_price))
+        except ValueError:
+            continue
+    return prices
+
+
+class UsageReport:
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.prices = prices or {}
+        self._models: Dict[str, Dict[str, float]] = {}
+        self._escalations: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record_call(self, model: str, result: dict) -> None:
+        usage = (result.get("raw") or {}).get("usage") or {}
+        with self._lock:
+            row = self._models.setdefault(model, {"calls": 0, "cached": 0, "prompt_tokens": 0,
+                                                  "completion_tokens": 0, "latency_s": 0.0})
+            row["calls"] += 1
+            if result.get("cached"):
+                # a cache hit costs nothing at the endpoint
+                row["cached"] += 1
+                return
+            row["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            row["completion_tokens"] += usage.get("completion_tokens") or 0
+            row["latency_s"] += result.get("latency") or 0.0
+
+    def record_escalation(self, domain: str, reason: str) -> None:
+        with self._lock:
+            row = self._escalations.setdefault(domain, {})
+            row[reason] = row.get(reason, 0) + 1
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        if model not in self.prices:
+            return None
+        prompt_price, completion_price = self.prices[model]
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            models = {}
+            for model, row in self._models.items():
+                sent = row["calls"] - row["cached"]
+                models[model] = dict(row,
+                                     latency_s=round(row["latency_s"], 3),
+                                     mean_latency_s=round(row["latency_s"] / sent, 4) if sent else 0.0,
+                                     cost=self.cost(model, row["prompt_tokens"], row["completion_tokens"]))
+            return {"models": models, "escalations": {d: dict(r) for d, r in self._escalations.items()}}
+
+    def format_report(self) -> str:
+        report = self.as_dict()
+        lines = ["Routing report:"]
+        for model, row in sorted(report["models"].items()):
+            cost = f", ${row['cost']:.4f}" if row["cost"] is not None else ""
+            lines.append(f"  {model}: {row['calls']} calls ({row['cached']} cached), "
+                         f"{row['prompt_tokens']} prompt + {row['completion_tokens']} completion tokens, "
+                         f"mean latency {row['mean_latency_s']}s{cost}")
+        for domain, reasons in sorted(report["escalations"].items()):
+            lines.append(f"  escalations in {domain}: " + ", ".join(f"{n} {r}" for r, n in sorted(reasons.items())))
+        return "\n".join(lines)
+
+
+# MODEL_PRICES="small=0.1/0.4,bens_model=0.5/1.5" (dollars per million prompt/completion tokens)
+REPORT = UsageReport(parse_prices(os.getenv("MODEL_PRICES", "")))
@@ -0,0 +1,347 @@
+"""
+Sandboxed execution of candidate code for the coding domain.
+
+A SandboxPool keeps a few warm worker processes (this file run with --worker).
+Each job is sent to a worker as one JSON line; on POSIX the worker forks a
+child per job, applies CPU / memory limits to it and runs the candidate code
+followed by the checks extracted from the question (doctest examples and
+assert lines; ones that don't compile, e.g. prose starting with "assert",
+are dropped, and prose right after a doctest example is cut from its
+expected output). The child may not start processes and its file writes are
+capped (RLIMIT_NPROC / RLIMIT_FSIZE). The parent enforces a wall-clock limit
+and replaces workers that hang or die.
+
+    pool = get_sandbox_pool()
+    result = pool.run(code, extract_tests(question))
+    result.status  # "passed", "failed", "timeout", "inconclusive" or "no_tests"
+"""
+
+from __future__ import annotations
+
+import ast
+import doctest
+import json
+import os
+import queue
+import re
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))
+WALL_SECONDS = float(os.getenv("SANDBOX_WALL_SECONDS", "10"))
+POOL_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+# candidate code may not start processes, and files it writes are capped
+MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", "0"))
+FILE_MB = int(os.getenv("SANDBOX_FILE_MB", "16"))
+
+# keep failure details short, they are pasted into a repair prompt
+MAX_DETAIL_CHARS = 1500
+
+
+@dataclass
+class SandboxResult:
+    status: str
+    detail: str = ""
+    tests_run: int = 0
+    duration: float = 0.0
+
+
+# --------------------------------------------------------------------------
+# Test extraction
+# --------------------------------------------------------------------------
+
+_ASSERT_RE = re.compile(r"^\s*(assert\s+.+)$", re.MULTILINE)
+_EXCEPTION_LINE_RE = re.compile(r"^[A-Za-z_][\w.]*(Error|Exception|Warning|Iteration|Exit|Interrupt)\b")
+_FENCE_RE = re.compile(r"```(?:python|py)?\s*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+def _looks_like_output(line: str) -> bool:
+    """A Python value, a traceback line or an ellipsis, as opposed to prose ("Return only the code.")."""
+    stripped = line.strip()
+    if not stripped or stripped == "..." or line[:1].isspace() or stripped.startswith("Traceback ("):
+        return True
+    if _EXCEPTION_LINE_RE.match(stripped):
+        return True
+    try:
+        ast.parse(stripped, mode="eval")
+    except SyntaxError:
+        return False
+    return True
+
+
+def _expected_output(want: str) -> str:
+    # examples at the end of a docstring pick up the closing quotes as expected output
+    lines = [line for line in want.splitlines(keepends=True) if line.strip() not in ('"""', "'''")]
+    # doctest output runs to the next blank line, so prose right after an example is swept
+    # in; keep the first line (printed text may look like prose) and cut at the next prose line
+    for i, line in enumerate(lines[1:], start=1):
+        if not _looks_like_output(line):
+            return "".join(lines[:i])
+    return "".join(lines)
+
+
+def extract_tests(question: str) -> List[str]:
+    """Doctest examples (>>> lines with expected output) and assert lines found in the question."""
+    tests = []
+    try:
+        examples = doctest.DocTestParser().get_examples(question)
+    except ValueError:
+        examples = []
+    for ex in examples:
+        tests.append(">>> " + ex.source.rstrip("\n").replace("\n", "\n... ") + "\n" + _expected_output(ex.want))
+    tests.extend(m.strip() for m in _ASSERT_RE.findall(question))
+    return tests
+
+
+def strip_code_fences(answer: str) -> str:
+    m = _FENCE_RE.search(answer)
+    return m.group(1).strip("\n") if m else answer.strip()
+
+
+# --------------------------------------------------------------------------
+# Worker side (runs in the sandbox process)
+# --------------------------------------------------------------------------
+
+def _run_job(job: dict) -> dict:
+    """Executes job["code"] and job["tests"] in the current process, inside a scratch directory."""
+    import io
+    import tempfile
+
+    start = time.perf_counter()
+    cwd = os.getcwd()
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = io.StringIO()
+    sys.stderr = io.StringIO()
+    try:
+        with tempfile.TemporaryDirectory(prefix="sandbox_") as scratch:
+            os.chdir(scratch)
+            try:
+                status, detail, tests_run = _execute(job["code"], job.get("tests", []))
+            finally:
+                os.chdir(cwd)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+    return asdict(SandboxResult(status, detail[-MAX_DETAIL_CHARS:], tests_run, time.perf_counter() - start))
+
+
+def _compiles(test: str) -> bool:
+    try:
+        if test.startswith(">>>"):
+            for ex in doctest.DocTestParser().get_examples(test):
+                compile(ex.source, "<test>", "exec")
+        else:
+            compile(test, "<test>", "exec")
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+def _execute(code: str, tests: List[str]):
+    import io
+    import traceback
+
+    globs = {"__name__": "__candidate__"}
+    try:
+        exec(compile(code, "<candidate>", "exec"), globs)
+    except ImportError as e:
+        # a third-party library missing here says nothing about the code
+        return "inconclusive", f"{type(e).__name__}: {e}", 0
+    except BaseException:
+        return "failed", traceback.format_exc(limit=3), 0
+
+    if not tests:
+        return "no_tests", "", 0
+    usable = [test for test in tests if _compiles(test)]
+    if not usable:
+        # only prose that looked like a test; the code hasn't really been checked
+        return "inconclusive", f"none of the {len(tests)} extracted tests compile", 0
+    tests = usable
+
+    runner = doctest.DocTestRunner(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+    parser = doctest.DocTestParser()
+    for i, test in enumerate(tests):
+        if test.startswith(">>>"):
+            out = io.StringIO()
+            dt = parser.get_doctest(test, globs, f"example_{i}", None, 0)
+            if runner.run(dt, out=out.write, clear_globs=False).failed:
+                # expected output that reads like text may be the question's prose, not printed output
+                if any(not _looks_like_output(line) for ex in dt.examples for line in ex.want.splitlines()):
+                    return "inconclusive", out.getvalue(), i + 1
+                return "failed", out.getvalue(), i + 1
+        else:
+            try:
+                exec(compile(test, f"<test_{i}>", "exec"), globs)
+            except ImportError as e:
+                return "inconclusive", f"{type(e).__name__}: {e}", i + 1
+            except BaseException:
+                return "failed", f"{test}\n{traceback.format_exc(limit=2)}", i + 1
+    return "passed", "", len(tests)
+
+
+def _apply_limits(cpu_seconds: int, memory_mb: int, max_processes: int = MAX_PROCESSES, file_mb: int = FILE_MB) -> None:
+    import resource
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    memory = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    # NPROC counts all of the user's processes, so this only stops new ones (root is exempt)
+    resource.setrlimit(resource.RLIMIT_NPROC, (max_processes, max_processes))
+    # a write past the limit raises OSError instead of killing the child with SIGXFSZ
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    file_size = file_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+
+
+def _run_job_forked(job: dict) -> dict:
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # child: no access to the worker's protocol pipes
+        os.close(read_fd)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        try:
+            _apply_limits(job["cpu_seconds"], job["memory_mb"], job.get("max_processes", MAX_PROCESSES),
+                          job.get("file_mb", FILE_MB))
+            payload = json.dumps(_run_job(job)).encode("utf-8")
+        except BaseException as e:
+            payload = json.dumps(asdict(SandboxResult("failed", f"{type(e).__name__}: {e}"))).encode("utf-8")
+        with os.fdopen(write_fd, "wb") as fp:
+            fp.write(payload)
+        os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = time.monotonic() + job["wall_seconds"]
+    with os.fdopen(read_fd, "rb") as fp:
+        while True:
+            remaining = deadline - time.monotonic()
+            ready, _, _ = select.select([fp], [], [], max(0.0, remaining))
+            if not ready:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                return asdict(SandboxResult("timeout", f"exceeded {job['wall_seconds']}s wall time"))
+            chunk = fp.read1(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    _, status = os.waitpid(pid, 0)
+    if not chunks:
+        if os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXCPU:
+            return asdict(SandboxResult("timeout", f"exceeded {job['cpu_seconds']}s CPU time"))
+        # usually the memory limit (MemoryError while reporting, or killed)
+        return asdict(SandboxResult("failed", f"process died (status {status}); memory limit is {job['memory_mb']} MB"))
+    return json.loads(b"".join(chunks))
+
+
+def _worker_main() -> None:
+    run = _run_job_forked if hasattr(os, "fork") else _run_job
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            result = run(job)
+        except BaseException as e:
+            result = asdict(SandboxResult("failed", f"{type(e).__name__}: {e}"))
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+# --------------------------------------------------------------------------
+# Parent side
+# --------------------------------------------------------------------------
+
+class _Worker:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1,
+        )
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, job: dict, timeout: float) -> Optional[dict]:
+        """Returns the job result, or None if the worker hung or died."""
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            return None
+        line = self.proc.stdout.readline()
+        return json.loads(line) if line else None
+
+    def kill(self) -> None:
+        if self.alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class SandboxPool:
+    def __init__(self, workers: int = POOL_WORKERS, cpu_seconds: int = CPU_SECONDS,
+                 memory_mb: int = MEMORY_MB, wall_seconds: float = WALL_SECONDS,
+                 max_processes: int = MAX_PROCESSES, file_mb: int = FILE_MB):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = wall_seconds
+        self.max_processes = max_processes
+        self.file_mb = file_mb
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker())
+
+    def run(self, code: str, tests: List[str]) -> SandboxResult:
+        job = {
+            "code": code,
+            "tests": tests,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+            "wall_seconds": self.wall_seconds,
+            "max_processes": self.max_processes,
+            "file_mb": self.file_mb,
+        }
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            # a little slack over the worker's own wall limit
+            result = worker.run(job, self.wall_seconds + 2)
+            if result is None or not worker.alive():
+                worker.kill()
+                worker = _Worker()
+        finally:
+            self._idle.put(worker)
+        if result is None:
+            result = asdict(SandboxResult("timeout", f"sandbox worker did not answer within {self.wall_seconds}s"))
+        result["duration"] = time.perf_counter() - start
+        return SandboxResult(**result)
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().kill()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SandboxPool()
+    return _pool
+
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    _worker_main()
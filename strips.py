@@ -0,0 +1,270 @@
+"""
+Local STRIPS plan checker for the planning domain.
+
+Parses a PlanBench-style problem statement (action schemas, initial conditions
+and goal) plus a proposed plan, and simulates the plan step by step:
+
+    check = check_plan(question, answer)
+    if check is None:      # problem couldn't be parsed, fall back to the LLM
+        ...
+    elif check.valid:
+        ...
+    else:
+        print(check.step, check.reason)
+
+Two problem styles are understood:
+  * the classic blocksworld description ("Pick up a block", "Unstack a block
+    from on top of another block", ...), whose rules are built in, and
+  * domains that spell out their rules ("To perform Attack action, the
+    following facts need to be true: ...", "Once Attack action is performed
+    the following facts will be true/false: ...").
+
+Facts are kept as normalised phrases ("red is clear", "a craves b"); schema
+facts use ?1 / ?2 for the action's first and second object.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# --------------------------------------------------------------------------
+# Data model
+# --------------------------------------------------------------------------
+
+@dataclass
+class ActionSchema:
+    name: str
+    arity: int
+    pre: List[str] = field(default_factory=list)
+    add: List[str] = field(default_factory=list)
+    delete: List[str] = field(default_factory=list)
+
+    def ground(self, args: List[str]) -> Tuple[Set[str], Set[str], Set[str]]:
+        def bind(facts: List[str]) -> Set[str]:
+            out = set()
+            for fact in facts:
+                for i, arg in enumerate(args, start=1):
+                    fact = fact.replace(f"?{i}", arg)
+                out.add(fact)
+            return out
+        return bind(self.pre), bind(self.add), bind(self.delete)
+
+
+@dataclass
+class Problem:
+    actions: Dict[str, ActionSchema]
+    initial: FrozenSet[str]
+    goal: FrozenSet[str]
+
+
+@dataclass
+class PlanCheck:
+    valid: bool
+    # 1-based index of the failing step; len(plan) + 1 when every step runs but the goal isn't reached
+    step: Optional[int] = None
+    reason: str = ""
+
+
+# --------------------------------------------------------------------------
+# Fact normalisation
+# --------------------------------------------------------------------------
+
+def _key(name: str) -> str:
+    """Action name key: 'Pick up' / 'pick-up' / 'pickup' all become 'pickup'."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def normalize_fact(text: str) -> str:
+    """Ground fact text -> canonical phrase, e.g. 'the red block is clear' -> 'red is clear'."""
+    fact = " ".join(text.lower().strip().strip(".").split())
+    fact = re.sub(r"^(and|that)\s+", "", fact)
+    fact = re.sub(r"\bthe (\w+) block\b", r"\1", fact)
+    fact = re.sub(r"\b(?:object|block) (\w+)\b", r"\1", fact)
+    if "holding" in fact:
+        held = fact.split("holding", 1)[1].split()
+        if held:
+            return f"holding {held[-1]}"
+    return fact
+
+
+def normalize_template(text: str) -> str:
+    """Schema fact text -> phrase with placeholders, e.g. 'Object Craves other object' -> '?1 craves ?2'."""
+    fact = " ".join(text.lower().strip().strip(".").split())
+    fact = re.sub(r"\b(?:another|other) object\b", "?2", fact)
+    fact = re.sub(r"\bobject\b", "?1", fact)
+    return fact
+
+
+def split_facts(text: str) -> List[str]:
+    parts = re.split(r",\s*|\s+and\s+", text.strip().strip("."))
+    return [p.strip() for p in parts if p.strip()]
+
+
+# --------------------------------------------------------------------------
+# Built-in classic blocksworld rules
+# --------------------------------------------------------------------------
+
+_HAND_EMPTY = "the hand is empty"
+
+BLOCKSWORLD = {
+    "pickup": ActionSchema(
+        "pickup", 1,
+        pre=["?1 is clear", "?1 is on the table", _HAND_EMPTY],
+        add=["holding ?1"],
+        delete=["?1 is clear", "?1 is on the table", _HAND_EMPTY],
+    ),
+    "putdown": ActionSchema(
+        "putdown", 1,
+        pre=["holding ?1"],
+        add=["?1 is clear", "?1 is on the table", _HAND_EMPTY],
+        delete=["holding ?1"],
+    ),
+    "stack": ActionSchema(
+        "stack", 2,
+        pre=["holding ?1", "?2 is clear"],
+        add=["?1 is on top of ?2", "?1 is clear", _HAND_EMPTY],
+        delete=["holding ?1", "?2 is clear"],
+    ),
+    "unstack": ActionSchema(
+        "unstack", 2,
+        pre=["?1 is on top of ?2", "?1 is clear", _HAND_EMPTY],
+        add=["holding ?1", "?2 is clear"],
+        delete=["?1 is on top of ?2", "?1 is clear", _HAND_EMPTY],
+    ),
+}
+
+
+# --------------------------------------------------------------------------
+# Problem parsing
+# --------------------------------------------------------------------------
+
+_PRE_RE = re.compile(r"To perform (\w[\w -]*?) action, the following (?:facts )?(?:needs?|need) to be true:,?\s*(.+)", re.IGNORECASE)
+_EFF_RE = re.compile(r"Once (\w[\w -]*?) action is performed the following (?:facts )?will be (true|false):,?\s*(.+)", re.IGNORECASE)
+_INIT_RE = re.compile(r"As initial conditions I have that,?\s*(.+?)\.\s*\n?\s*My goal is to have that\s*(.+?)\.\s*(?:\n|$)", re.IGNORECASE | re.DOTALL)
+
+
+def _action_arities(question: str) -> Dict[str, int]:
+    """Reads the 'Here are the actions I can do' list: 'Feast object from another object' -> feast: 2."""
+    arities = {}
+    m = re.search(r"actions I can do\s*\n(.*?)\n\s*\n", question, re.IGNORECASE | re.DOTALL)
+    if not m:
+        return arities
+    for line in m.group(1).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        name = line.split()[0]
+        arities[_key(name)] = len(re.findall(r"\bobject\b", line, re.IGNORECASE))
+    return arities
+
+
+def _parse_schemas(question: str) -> Dict[str, ActionSchema]:
+    arities = _action_arities(question)
+    schemas: Dict[str, ActionSchema] = {}
+
+    def schema(name: str) -> ActionSchema:
+        key = _key(name)
+        if key not in schemas:
+            schemas[key] = ActionSchema(key, arities.get(key, 0))
+        return schemas[key]
+
+    for line in question.splitlines():
+        line = line.strip()
+        m = _PRE_RE.match(line)
+        if m:
+            schema(m.group(1)).pre.extend(normalize_template(f) for f in split_facts(m.group(2)))
+            continue
+        m = _EFF_RE.match(line)
+        if m:
+            target = schema(m.group(1)).add if m.group(2).lower() == "true" else schema(m.group(1)).delete
+            target.extend(normalize_template(f) for f in split_facts(m.group(3)))
+
+    for s in schemas.values():
+        if not s.arity:
+            s.arity = max((int(n) for f in s.pre + s.add + s.delete for n in re.findall(r"\?(\d)", f)), default=0)
+    return schemas
+
+
+def parse_problem(question: str) -> Optional[Problem]:
+    """Returns the problem to solve (the last [STATEMENT] in the prompt) or None if it can't be parsed."""
+    lowered = question.lower()
+    if "pick up a block" in lowered and "unstack a block" in lowered:
+        actions = BLOCKSWORLD
+    else:
+        actions = _parse_schemas(question)
+    if not actions:
+        return None
+
+    statements = _INIT_RE.findall(question)
+    if not statements:
+        return None
+    init_text, goal_text = statements[-1]
+    initial = frozenset(normalize_fact(f) for f in split_facts(init_text))
+    goal = frozenset(normalize_fact(f) for f in split_facts(goal_text))
+    if not initial or not goal:
+        return None
+    return Problem(actions, initial, goal)
+
+
+# --------------------------------------------------------------------------
+# Plan parsing and simulation
+# --------------------------------------------------------------------------
+
+def parse_plan_line(line: str, actions: Dict[str, ActionSchema]) -> Optional[Tuple[str, List[str]]]:
+    """'(unstack red blue)' or 'unstack the red block from on top of the blue block' -> ('unstack', ['red', 'blue'])"""
+    line = line.strip().lower()
+    if line.startswith("(") and line.endswith(")"):
+        tokens = line[1:-1].split()
+        if not tokens:
+            return None
+        return _key(tokens[0]), [normalize_fact(t) for t in tokens[1:]]
+
+    words = line.split()
+    if not words:
+        return None
+    # 'pick up' / 'put down' are two words in natural-language plans
+    name = _key(" ".join(words[:2])) if _key(" ".join(words[:2])) in actions else _key(words[0])
+    args = re.findall(r"\bthe (\w+) block\b", line) or re.findall(r"\b(?:object|block) (\w+)\b", line)
+    return name, args
+
+
+def validate_plan(problem: Problem, plan: List[str]) -> PlanCheck:
+    state: Set[str] = set(problem.initial)
+    for step, line in enumerate(plan, start=1):
+        parsed = parse_plan_line(line, problem.actions)
+        if parsed is None:
+            return PlanCheck(False, step, f"could not parse plan line {line!r}")
+        name, args = parsed
+        schema = problem.actions.get(name)
+        if schema is None:
+            return PlanCheck(False, step, f"unknown action {name!r} in {line!r}")
+        if len(args) != schema.arity:
+            return PlanCheck(False, step, f"{line!r} has {len(args)} arguments, {name} takes {schema.arity}")
+        pre, add, delete = schema.ground(args)
+        missing = sorted(pre - state)
+        if missing:
+            return PlanCheck(False, step, f"{line!r} is not applicable: these facts are false at that point: {', '.join(missing)}")
+        state = (state - delete) | add
+
+    missing_goal = sorted(problem.goal - state)
+    if missing_goal:
+        return PlanCheck(False, len(plan) + 1, f"after the last step the goal is not reached; still false: {', '.join(missing_goal)}")
+    return PlanCheck(True)
+
+
+def plan_lines(answer: str) -> List[str]:
+    lines = [line.strip() for line in answer.strip().splitlines()]
+    return [line for line in lines if line and line.lower() != "[plan end]"]
+
+
+def check_plan(question: str, answer: str) -> Optional[PlanCheck]:
+    """Simulates answer against question; None when the problem statement couldn't be parsed."""
+    problem = parse_problem(question)
+    if problem is None:
+        return None
+    lines = plan_lines(answer)
+    if not lines:
+        return PlanCheck(False, 1, "the plan is empty")
+    return validate_plan(problem, lines)
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the modules live at the top of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import generate_answer_template  # noqa: E402
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    """Replaces run_agent with an upper-casing stub; questions listed in .fail raise. .calls logs every question."""
+    class FakeAgent:
+        def __init__(self):
+            self.calls = []
+            self.fail = set()
+
+        def __call__(self, question, verbose=False):
+            self.calls.append(question)
+            if question in self.fail:
+                raise RuntimeError("agent failed")
+            return question.upper()
+
+    agent = FakeAgent()
+    monkeypatch.setattr(generate_answer_template, "run_agent", agent)
+    return agent
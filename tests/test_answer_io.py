@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from generate_answer_template import AnswerWriter, iter_json_records, iter_questions, validate_results
+
+RECORDS = [{"input": "q" * 50, "n": 12345}, {"input": "ünïcode [brackets], \"quotes\""}, 7, 1.5, None, [1, [2]]]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1 << 16])
+def test_json_array_in_small_chunks(tmp_path, chunk_size):
+    path = tmp_path / "questions.json"
+    path.write_text(json.dumps(RECORDS, indent=2, ensure_ascii=False), encoding="utf-8")
+    assert list(iter_json_records(path, chunk_size=chunk_size)) == RECORDS
+
+
+def test_number_split_across_chunks(tmp_path):
+    path = tmp_path / "numbers.json"
+    path.write_text("[123456789, 42]")
+    assert list(iter_json_records(path, chunk_size=4)) == [123456789, 42]
+
+
+def test_jsonl_and_empty_inputs(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in RECORDS) + "\n\n")
+    assert list(iter_json_records(path, chunk_size=8)) == RECORDS
+    for text in ("", "   \n", "[]", " [ ] "):
+        path.write_text(text)
+        assert list(iter_json_records(path)) == []
+
+
+@pytest.mark.parametrize("text", ['[{"input": "a"}, {"inp', '[1, 2', "{\"a\": 1}\nnot json\n"])
+def test_malformed_input(tmp_path, text):
+    path = tmp_path / "broken.json"
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_json_records(path, chunk_size=4))
+
+
+def test_iter_questions_needs_objects(tmp_path):
+    path = tmp_path / "questions.json"
+    path.write_text('[{"input": "a"}, "b"]')
+    with pytest.raises(ValueError):
+        list(iter_questions(path))
+
+
+@pytest.mark.parametrize("answers", [[], [{"output": "42"}], [{"output": "a\nb"}, {"output": "ünï \"q\""}, {"output": ""}]])
+def test_answer_writer_matches_json_dump(tmp_path, answers):
+    path = tmp_path / "answers.json"
+    with AnswerWriter(path) as writer:
+        for answer in answers:
+            writer.write(answer)
+    assert writer.count == len(answers)
+    assert path.read_text(encoding="utf-8") == json.dumps(answers, ensure_ascii=False, indent=2)
+    assert not (tmp_path / "answers.json.tmp").exists()
+
+
+def test_answer_writer_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / "answers.json"
+    path.write_text("[]")
+    with pytest.raises(RuntimeError):
+        with AnswerWriter(path) as writer:
+            writer.write({"output": "partial"})
+            raise RuntimeError("crash")
+    assert path.read_text() == "[]"
+    assert not (tmp_path / "answers.json.tmp").exists()
+
+
+def test_validate_results_streams_and_checks_lengths():
+    validate_results(iter([{"input": "a"}]), iter([{"output": "x"}]))
+    with pytest.raises(ValueError, match="Mismatched lengths"):
+        validate_results(iter([{"input": "a"}, {"input": "b"}]), iter([{"output": "x"}]))
+    with pytest.raises(TypeError):
+        validate_results(iter([{"input": "a"}]), iter([{"output": 1}]))
+    with pytest.raises(ValueError, match="5000"):
+        validate_results(iter([{"input": "a"}]), iter([{"output": "x" * 5000}]))
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+
+import agent
+from backends import Backend, BackendPool, parse_spec
+from mock_server import MockChatServer
+from rate_limit import AIMDLimiter, RetryPolicy
+
+# nothing listens on these ports, so requests fail at once with a connection error
+DEAD_URLS = ("http://127.0.0.1:9/v1", "http://127.0.0.1:7/v1")
+
+
+def test_parse_spec():
+    backends = parse_spec(" http://a/v1=2, http://b/v1 ,,http://c/v1?x=y")
+    assert [(b.url, b.weight) for b in backends] == [("http://a/v1", 2.0), ("http://b/v1", 1.0), ("http://c/v1?x=y", 1.0)]
+    with pytest.raises(ValueError):
+        BackendPool([])
+    with pytest.raises(ValueError):
+        BackendPool([Backend("http://a")], strategy="random")
+
+
+def test_least_outstanding_respects_weights_and_exclude():
+    heavy, light = Backend("http://heavy", weight=3), Backend("http://light")
+    pool = BackendPool([heavy, light])
+    chosen = [pool.choose() for _ in range(4)]
+    assert chosen.count(heavy) == 3 and chosen.count(light) == 1
+    assert pool.choose(exclude=[heavy]) is light
+    # everything excluded: still answers rather than failing the request
+    assert pool.choose(exclude=[heavy, light]) in (heavy, light)
+
+
+def test_ewma_prefers_the_faster_replica():
+    fast, slow = Backend("http://fast"), Backend("http://slow")
+    pool = BackendPool([fast, slow], strategy="ewma")
+    pool.release(pool.choose(exclude=[slow]), 200, 0.05)
+    pool.release(pool.choose(exclude=[fast]), 200, 0.5)
+    picks = []
+    for _ in range(5):
+        backend = pool.choose()
+        picks.append(backend)
+        pool.release(backend, 200, 0.05 if backend is fast else 0.5)
+    assert picks.count(fast) == 5
+
+
+def test_consecutive_failures_mark_a_replica_down_until_cooldown():
+    bad, good = Backend("http://bad"), Backend("http://good")
+    pool = BackendPool([bad, good], failure_threshold=2, cooldown=0.2)
+    pool.release(pool.choose(exclude=[good]), 503, 0.0)
+    pool.release(pool.choose(exclude=[good]), 200, 0.0)
+    pool.release(pool.choose(exclude=[good]), 503, 0.0)
+    # a success in between resets the count
+    assert bad.healthy(time.monotonic())
+    pool.release(pool.choose(exclude=[good]), -1, 0.0)
+    assert not bad.healthy(time.monotonic()) and bad.marked_down == 1
+    assert not pool.has_alternative([good])
+    assert all(pool.choose() is good for _ in range(3))
+    # a 4xx is about the request, not the replica
+    pool.release(pool.choose(exclude=[bad]), 400, 0.0)
+    assert good.consecutive_failures == 0
+    time.sleep(0.25)
+    assert pool.has_alternative([good])
+
+
+def test_health_checks_take_replicas_out_and_back():
+    a, b = Backend("http://a"), Backend("http://b")
+    pool = BackendPool([a, b], cooldown=60.0)
+    down = set()
+
+    def probe(url):
+        if url == "http://b":
+            raise OSError("unreachable")
+        return url not in down
+
+    pool.check_health(probe)
+    now = time.monotonic()
+    assert a.healthy(now) and not b.healthy(now)
+    down.add("http://a")
+    pool.check_health(probe)
+    assert not a.healthy(time.monotonic())
+    down.clear()
+    pool.check_health(probe)
+    assert a.healthy(time.monotonic())
+
+
+@pytest.fixture
+def backend_pool(monkeypatch):
+    monkeypatch.setattr(agent, "RETRY_POLICY", RetryPolicy(max_retries=1, base_delay=0.01))
+    monkeypatch.setattr(agent, "LIMITER", AIMDLimiter(initial=8))
+
+    def install(*backends):
+        pool = BackendPool(backends, failure_threshold=1, cooldown=60.0)
+        agent.set_backend_pool(pool)
+        return pool
+
+    yield install
+    agent.set_backend_pool(None)
+
+
+def call():
+    return agent.call_model_chat_completions("What is 2 + 2?", use_cache=False, timeout=5)
+
+
+def test_dead_replicas_fail_over_without_spending_retries(backend_pool):
+    with MockChatServer() as server:
+        # the heavier dead replicas are tried first
+        pool = backend_pool(*(Backend(url, weight=2) for url in DEAD_URLS), Backend(server.url))
+        results = [call() for _ in range(5)]
+    assert all(r["ok"] and r["retries"] == 0 and r["backend"] == server.url for r in results)
+    # the first call marks both dead replicas down; later calls skip them
+    assert [r["failovers"] for r in results] == [2, 0, 0, 0, 0]
+    assert pool.failovers == 2
+    assert [(b.requests, b.marked_down) for b in pool.backends[:2]] == [(1, 1), (1, 1)]
+
+
+def test_429_backs_off_instead_of_failing_over(backend_pool):
+    with MockChatServer(error_rate=1.0, error_status=429, retry_after=0.0) as throttled, MockChatServer() as server:
+        pool = backend_pool(Backend(throttled.url, weight=2), Backend(server.url))
+        result = call()
+    # the retry goes to the other replica, but as a backed-off retry, not a failover
+    assert result["ok"] and result["retries"] == 1 and result["failovers"] == 0
+    assert pool.failovers == 0 and pool.backends[0].marked_down == 0
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import generate_answer_template
+from generate_answer_template import build_answers, stream_answers
+
+
+def test_answers_keep_input_order_when_workers_finish_out_of_order(monkeypatch):
+    finished = []
+    lock = threading.Lock()
+
+    def slow_first(question, verbose=False):
+        # earlier questions take longer, so they complete last
+        time.sleep(0.05 * (5 - int(question[1:])))
+        with lock:
+            finished.append(question)
+        return question.upper()
+
+    monkeypatch.setattr(generate_answer_template, "run_agent", slow_first)
+    questions = [{"input": f"q{i}"} for i in range(6)]
+    answers = build_answers(questions, max_workers=4, checkpoint_path=None, dedup_mode="off")
+    assert answers == [{"output": f"Q{i}"} for i in range(6)]
+    assert finished != sorted(finished)
+
+
+def test_questions_are_read_lazily(fake_agent):
+    read = []
+
+    def questions():
+        for i in range(100):
+            read.append(i)
+            yield {"input": f"q{i}"}
+
+    answers = stream_answers(questions(), max_workers=2, checkpoint_path=None, dedup_mode="off", max_pending=4)
+    assert next(answers) == {"output": "Q0"}
+    assert len(read) < 10
+    assert len(list(answers)) == 99
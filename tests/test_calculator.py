@@ -0,0 +1,53 @@
+from fractions import Fraction
+
+import pytest
+
+from calculator import CalculatorError, evaluate
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("round((3*2.49)*1.07, 2)", 7.99),
+    ("2**10", 1024),
+    ("(-8)**3", -512),
+    ("(-8)**-2", 0.015625),
+    ("Fraction(1, 3) + Fraction(1, 6)", Fraction(1, 2)),
+    ("sqrt(16) + log(8, 2)", 7.0),
+    ("comb(10, 3)", 120),
+    ("17 // 5 + 17 % 5", 5),
+    ("12.5.", 12.5),
+    ("2**-5000", 0.0),
+    ("10**-1001", 0.0),
+    ("round(Fraction(2, 3), 3)", Fraction(667, 1000)),
+    ("round(1234, -2)", 1200),
+    ("round(2.5)", 2),
+])
+def test_evaluate(expression, expected):
+    assert evaluate(expression) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("expression", [
+    "9**9**9",
+    "10**1001",
+    "0.5**-5000",
+    "Fraction(1, 3)**-5000",
+    "round(Fraction(1, 3), 10**9)",
+    "round(2, -10**9)",
+    "factorial(10000)",
+    "comb(10**6, 3)",
+    "1/0",
+    "sqrt(-1)",
+    "(-8)**(1/3)",
+    "(-8)**Fraction(1, 3)",
+    "__import__('os')",
+    "x + 1",
+    "2 +",
+    "1" * 501,
+])
+def test_rejected(expression):
+    with pytest.raises(CalculatorError):
+        evaluate(expression)
+
+
+def test_error_is_a_value_error():
+    with pytest.raises(ValueError):
+        evaluate("(-1)**0.5")
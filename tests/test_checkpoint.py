@@ -0,0 +1,81 @@
+import json
+
+from generate_answer_template import build_answers, load_checkpoint
+
+
+def questions(*texts):
+    return [{"input": text} for text in texts]
+
+
+def test_resume_skips_answered_questions(tmp_path, fake_agent):
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    qs = questions("q0", "q1", "q2")
+    assert build_answers(qs, checkpoint_path=checkpoint) == [{"output": "Q0"}, {"output": "Q1"}, {"output": "Q2"}]
+
+    fake_agent.calls.clear()
+    assert build_answers(qs, checkpoint_path=checkpoint) == [{"output": "Q0"}, {"output": "Q1"}, {"output": "Q2"}]
+    assert fake_agent.calls == []
+
+
+def test_failed_questions_are_solved_again(tmp_path, fake_agent):
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    qs = questions("q0", "q1", "q2")
+    fake_agent.fail = {"q1"}
+    assert build_answers(qs, checkpoint_path=checkpoint)[1] == {"output": ""}
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert [r.get("error", False) for r in sorted(records, key=lambda r: r["index"])] == [False, True, False]
+    assert 1 not in load_checkpoint(checkpoint)
+    assert load_checkpoint(checkpoint, include_errors=True)[1]["error"] is True
+
+    fake_agent.fail = set()
+    fake_agent.calls.clear()
+    assert build_answers(qs, checkpoint_path=checkpoint)[1] == {"output": "Q1"}
+    assert fake_agent.calls == ["q1"]
+    assert "error" not in load_checkpoint(checkpoint)[1]
+
+
+def test_records_of_changed_questions_are_ignored(tmp_path, fake_agent, capsys):
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    build_answers(questions("q0", "q1"), checkpoint_path=checkpoint)
+    fake_agent.calls.clear()
+    assert build_answers(questions("q0", "edited"), checkpoint_path=checkpoint) == [{"output": "Q0"}, {"output": "EDITED"}]
+    assert fake_agent.calls == ["edited"]
+    assert "Ignored 1 checkpoint records" in capsys.readouterr().out
+
+
+def test_torn_last_line_and_out_of_range_records(tmp_path, fake_agent):
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    checkpoint.write_text(
+        json.dumps({"index": 0, "output": "a"}) + "\n"
+        + json.dumps({"index": 5, "output": "b"}) + "\n"
+        + json.dumps({"index": -1, "output": "c"}) + "\n"
+        + '{"index": 1, "outp'
+    )
+    assert set(load_checkpoint(checkpoint)) == {0, 5}
+    assert set(load_checkpoint(checkpoint, num_questions=2)) == {0}
+    assert load_checkpoint(tmp_path / "missing.jsonl") == {}
+
+    # resuming after the torn line: the records written next don't land on it
+    checkpoint = tmp_path / "resumed.checkpoint.jsonl"
+    qs = questions("q0", "q1", "q2")
+    build_answers(qs[:1], checkpoint_path=checkpoint)
+    # a crash in the middle of writing question 2's record
+    with checkpoint.open("a") as fp:
+        fp.write('{"index": 2, "outp')
+
+    fake_agent.calls.clear()
+    assert build_answers(qs, checkpoint_path=checkpoint) == [{"output": "Q0"}, {"output": "Q1"}, {"output": "Q2"}]
+    assert fake_agent.calls == ["q1", "q2"]
+    assert set(load_checkpoint(checkpoint)) == {0, 1, 2}
+    fake_agent.calls.clear()
+    build_answers(qs, checkpoint_path=checkpoint)
+    assert fake_agent.calls == []
+
+
+def test_duplicates_are_solved_once_and_checkpointed(tmp_path, fake_agent):
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    answers = build_answers(questions("q0", "q1", "q0"), checkpoint_path=checkpoint, dedup_mode="exact")
+    assert answers == [{"output": "Q0"}, {"output": "Q1"}, {"output": "Q0"}]
+    assert sorted(fake_agent.calls) == ["q0", "q1"]
+    copy = load_checkpoint(checkpoint)[2]
+    assert copy["duplicate_of"] == 0 and copy["calls"] == 0
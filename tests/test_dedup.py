@@ -0,0 +1,52 @@
+import pytest
+
+from dedup import DuplicateIndex, find_duplicates, group_key
+
+
+def test_exact_mode_merges_only_normalised_repeats():
+    texts = ["What is 2 + 2?", "  What is  2 + 2?\n", "What is 2 + 3?", "what is 2 + 2?"]
+    assert find_duplicates(texts, mode="exact").canonical == [0, 0, 2, 3]
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Please solve the following: compute 17 * 23 and give the product.",
+     "Solve the following: compute 17 * 23 and give the product."),
+    ("Using the numbers 3 3 8 8, make 24 with + - * / and give the expression.",
+     "Using 3 3 8 8, make 24 with + - * / and give the expression."),
+])
+def test_near_mode_merges_filler_variants(a, b):
+    assert find_duplicates([a, b], mode="near").canonical == [0, 0]
+    assert group_key(a) == group_key(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    # a different number
+    ("Using the numbers 3 3 8 8, make 24 with + - * / and give the expression.",
+     "Using the numbers 3 3 8 9, make 24 with + - * / and give the expression."),
+    # one word swapped for another
+    ("Using the numbers 3 3 8 8, make 24 with + - * / and give the expression.",
+     "Using the numbers 3 3 8 8, make 24 with + - * / and give an expression."),
+    ("As initial conditions the red block is clear and the blue block is on the table. Goal: stack red on blue.",
+     "As initial conditions the red block is clear and the green block is on the table. Goal: stack red on blue."),
+    ("Is the answer blue and green according to the passage above, yes or no?",
+     "Is the answer blue or green according to the passage above, yes or no?"),
+    # a logical word dropped
+    ("Which of the cities below is not in Europe, given the list in the question?",
+     "Which of the cities below is in Europe, given the list in the question?"),
+])
+def test_near_mode_keeps_different_questions_apart(a, b):
+    assert find_duplicates([a, b], mode="near").canonical == [0, 1]
+
+
+def test_off_mode_and_unknown_mode():
+    assert find_duplicates(["x", "x"], mode="off").canonical == [0, 1]
+    with pytest.raises(ValueError):
+        DuplicateIndex("fuzzy")
+
+
+def test_index_counts_and_earliest_match():
+    index = DuplicateIndex("near")
+    texts = ["Please compute 12 * 12 for me.", "Compute 12 * 12 for me.", "Compute 12 * 12 for me.", "Compute 12 * 13."]
+    assert [index.add(t) for t in texts] == [0, 0, 0, 3]
+    assert index.groups.as_dict() == {"questions": 4, "unique": 2, "exact_duplicates": 1, "near_duplicates": 1}
+
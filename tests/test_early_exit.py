@@ -0,0 +1,74 @@
+import pytest
+
+import agent
+import validators
+
+MATH = "What is 6 * 7? Answer with a number."
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = validators.EarlyExitStats()
+    monkeypatch.setattr(validators, "STATS", stats)
+    monkeypatch.setattr(agent, "EARLY_EXIT", True)
+    return stats
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    prompts = []
+
+    def self_verification(question, answer, domain, verbose=True, escalate=False):
+        prompts.append(answer)
+        return answer
+
+    monkeypatch.setattr(agent, "self_verification", self_verification)
+    return prompts
+
+
+def fake_call(monkeypatch, name, result):
+    # stands in for a stage that makes one LLM call
+    def stage(*args, **kwargs):
+        agent._count_call({"cached": False, "latency": 0.0})
+        return result
+    monkeypatch.setattr(agent, name, stage)
+
+
+def test_accepted_answer_skips_the_verifier(monkeypatch, stats, verifier):
+    monkeypatch.setattr(agent, "chain_of_thought", lambda question, answer, domain: answer.strip())
+    assert agent.finalize_answer(MATH, "42", "math", verbose=False) == "42"
+    assert verifier == []
+    assert stats.as_dict() == {"checked": 1, "accepted": 1, "calls_saved": 1}
+
+
+def test_answer_changed_by_cot_is_rechecked(monkeypatch, stats, verifier):
+    monkeypatch.setattr(agent, "chain_of_thought", lambda question, answer, domain: "forty-two")
+    agent.finalize_answer(MATH, "42", "math", verbose=False)
+    assert verifier == ["forty-two"]
+    assert stats.as_dict() == {"checked": 1, "accepted": 0, "calls_saved": 0}
+
+
+def test_no_applicable_validator_is_not_counted(monkeypatch, stats, verifier):
+    agent.finalize_answer("Who wrote Hamlet?", "Shakespeare", "common sense", verbose=False)
+    assert verifier == ["Shakespeare"]
+    assert stats.checked == 0
+
+
+def test_simulated_plan_counts_skipped_cot_and_repairs(monkeypatch, stats, verifier):
+    monkeypatch.setattr(agent.strips, "parse_problem", lambda question: object())
+    # one repair call before the plan passed
+    fake_call(monkeypatch, "check_and_repair_plan", "(pick-up a)")
+    with agent.count_calls() as counter:
+        assert agent.finalize_answer("[PLAN]", "(pick-up b)", "planning", verbose=False) == "(pick-up a)"
+    assert counter.calls == 1 and verifier == []
+    policy = agent.route("planning")
+    assert stats.as_dict() == {"checked": 1, "accepted": 1, "calls_saved": agent._min_cot_calls(policy) + 1 - 1}
+
+
+def test_rejected_plan_costs_its_repairs(monkeypatch, stats, verifier):
+    monkeypatch.setattr(agent.strips, "parse_problem", lambda question: object())
+    monkeypatch.setattr(agent, "chain_of_thought", lambda question, answer, domain: answer.strip())
+    fake_call(monkeypatch, "check_and_repair_plan", None)
+    agent.finalize_answer("[PLAN]", "(pick-up b)", "planning", verbose=False)
+    assert verifier == ["(pick-up b)"]
+    assert stats.as_dict() == {"checked": 1, "accepted": 0, "calls_saved": -1}
@@ -0,0 +1,68 @@
+import pytest
+
+import agent
+import llm_cache
+from llm_cache import ResponseCache, make_cache_key
+from mock_server import MockChatServer
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_key_covers_every_field():
+    base = make_cache_key("m", "sys", "p", 0.0, 128)
+    assert base == make_cache_key("m", "sys", "p", 0.0, 128, sample=0)
+    for key in (make_cache_key("m2", "sys", "p", 0.0, 128), make_cache_key("m", "sys2", "p", 0.0, 128),
+                make_cache_key("m", "sys", "p2", 0.0, 128), make_cache_key("m", "sys", "p", 0.7, 128),
+                make_cache_key("m", "sys", "p", 0.0, 64), make_cache_key("m", "sys", "p", 0.0, 128, sample=1),
+                make_cache_key("m", "sys", "p", 0.0, 128, n=3)):
+        assert key != base
+
+
+def test_hits_misses_and_overwrite(cache):
+    assert cache.get("a") is None
+    cache.put("a", {"text": 1})
+    cache.put("a", {"text": 2})
+    assert cache.get("a") == {"text": 2}
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1, "evictions": 0}
+
+
+def test_least_recently_used_is_evicted(cache):
+    for key in "abc":
+        cache.put(key, {"key": key})
+    # reading "a" makes "b" the least recently used
+    assert cache.get("a") is not None
+    cache.put("d", {"key": "d"})
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["entries"] == 3 and cache.stats()["evictions"] == 1
+
+
+def test_entries_persist_across_reopen(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first = ResponseCache(path)
+    first.put("a", {"text": "x"})
+    first.close()
+    second = ResponseCache(path)
+    assert second.get("a") == {"text": "x"} and second.stats()["entries"] == 1
+    second.close()
+
+
+def test_only_deterministic_calls_are_cached_by_default(monkeypatch, cache):
+    monkeypatch.setattr(llm_cache, "_default_cache", cache)
+    monkeypatch.setattr(llm_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(agent, "CACHE_SAMPLED", False)
+    with MockChatServer() as server:
+        results = [agent.call_model_chat_completions("What is 2 + 2?", api_base=server.url) for _ in range(2)]
+        assert [r["cached"] for r in results] == [False, True]
+        sampled = [agent.call_model_chat_completions("What is 2 + 2?", api_base=server.url, temperature=0.7, sample=1)
+                   for _ in range(2)]
+        assert [r["cached"] for r in sampled] == [False, False]
+        forced = [agent.call_model_chat_completions("What is 2 + 2?", api_base=server.url, temperature=0.7, sample=1,
+                                                    use_cache=True) for _ in range(2)]
+        assert [r["cached"] for r in forced] == [False, True]
+        assert server.stats.requests == 4
@@ -0,0 +1,108 @@
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+import agent
+from mock_server import MockChatServer
+from rate_limit import AIMDLimiter, RetryPolicy, parse_retry_after
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(agent, "RETRY_POLICY", RetryPolicy(max_retries=3, base_delay=0.01, max_delay=1.0))
+    limiter = AIMDLimiter(initial=8, cooldown=0.0)
+    monkeypatch.setattr(agent, "LIMITER", limiter)
+    return limiter
+
+
+def call(server, **kwargs):
+    return agent.call_model_chat_completions("What is 2 + 2?", api_base=server.url, use_cache=False, **kwargs)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+
+def test_retry_delay():
+    policy = RetryPolicy(max_retries=2, base_delay=0.5, max_delay=3.0)
+    assert policy.delay(0, "2") == 2.0
+    assert policy.delay(0, "120") == 3.0
+    assert all(0 <= policy.delay(attempt) <= min(3.0, 0.5 * 2 ** attempt) for attempt in range(6) for _ in range(20))
+    assert policy.should_retry(503, 1) and not policy.should_retry(503, 2)
+    assert not policy.should_retry(400, 0)
+
+
+def test_failures_are_retried_until_success(fast_retries):
+    with MockChatServer(error_rate=0.5, seed=3) as server:
+        results = [call(server) for _ in range(10)]
+        stats = server.stats.as_dict()
+    assert all(r["ok"] for r in results if r["retries"] < 3)
+    assert sum(r["retries"] for r in results) == stats["errors"] > 0
+    assert stats["requests"] == 10 + stats["errors"]
+
+
+def test_retries_stop_at_max_retries(fast_retries):
+    with MockChatServer(error_rate=1.0) as server:
+        result = call(server)
+        assert server.stats.requests == 4
+    assert not result["ok"] and result["status"] == 503 and result["retries"] == 3
+
+
+def test_non_retryable_status_fails_at_once(fast_retries):
+    with MockChatServer(error_rate=1.0, error_status=400) as server:
+        result = call(server)
+        assert server.stats.requests == 1
+    assert result["status"] == 400 and result["retries"] == 0
+
+
+def test_retry_after_is_honoured_and_429_halves_the_limit(fast_retries):
+    with MockChatServer(error_rate=1.0, error_status=429, retry_after=0.3) as server:
+        start = time.perf_counter()
+        result = call(server)
+        elapsed = time.perf_counter() - start
+    assert result["status"] == 429 and result["retries"] == 3
+    # three waits of the server's 0.3 s, not the 10 ms backoff
+    assert elapsed >= 0.9
+    assert fast_retries.stats() == {"limit": 1, "in_flight": 0, "throttled": 4}
+
+
+def test_aimd_limiter():
+    limiter = AIMDLimiter(initial=8, min_limit=2, max_limit=10, increase_every=3, cooldown=60.0)
+    for status in (429, 429):
+        limiter.acquire()
+        limiter.release(status)
+    # one overload seen by several requests only halves the limit once per cooldown
+    assert limiter.stats() == {"limit": 4, "in_flight": 0, "throttled": 2}
+    for _ in range(6):
+        with limiter.slot() as slot:
+            slot.report(200)
+    assert limiter.stats()["limit"] == 6
+    limiter.cooldown = 0.0
+    for _ in range(3):
+        with limiter.slot() as slot:
+            slot.report(429)
+    assert limiter.stats()["limit"] == 2
+
+
+def test_limiter_blocks_at_the_limit():
+    limiter = AIMDLimiter(initial=1)
+    limiter.acquire()
+    entered = threading.Event()
+
+    def second():
+        limiter.acquire()
+        entered.set()
+        limiter.release(200)
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not entered.wait(0.1)
+    limiter.release(200)
+    assert entered.wait(1.0)
+    thread.join()
@@ -0,0 +1,81 @@
+import pytest
+
+import agent
+import replay
+from mock_server import MockChatServer
+
+STOP = lambda partial: None  # noqa: E731
+
+
+@pytest.fixture
+def store_at(tmp_path):
+    stores = []
+
+    def open_store(mode):
+        store = replay.CallStore(tmp_path / "calls.sqlite", mode)
+        replay.set_call_store(store)
+        stores.append(store)
+        return store
+
+    yield open_store
+    replay.set_call_store(None)
+    for store in stores:
+        store.close()
+
+
+@pytest.fixture
+def streaming(monkeypatch):
+    monkeypatch.setattr(agent, "STREAM", True)
+    monkeypatch.setattr(agent, "_stream_supported", agent.FeatureSupport(r"\bstream"))
+
+
+def key(**changes):
+    fields = dict(model="m", system="sys", prompt="p", temperature=0.0, max_tokens=128, sample=0,
+                  conversation={}, n=1, tools=None, tool_choice=None, streamed=False)
+    fields.update(changes)
+    return agent._request_key(**fields)
+
+
+def test_request_key_fields():
+    assert key() == key()
+    for change in ({"prompt": "q"}, {"temperature": 0.7}, {"sample": 1}, {"n": 3}, {"max_tokens": 64},
+                   {"tools": [{"type": "function"}]}, {"streamed": True}):
+        assert key(**change) != key(), change
+    # defaults don't join the key, so entries written before these fields existed stay valid
+    assert key(n=1, tools=None) == key()
+
+
+def test_replay_does_not_depend_on_streaming_state(store_at, streaming):
+    with MockChatServer(scripted=[(r".*", "FINAL: 4")]) as server:
+        store = store_at("record")
+        assert agent.call_model_chat_completions("q1", api_base=server.url, use_cache=False, stream_stop=STOP)["ok"]
+        # the recording run turned streaming off partway through
+        agent._stream_supported.disable()
+        assert agent.call_model_chat_completions("q2", api_base=server.url, use_cache=False, stream_stop=STOP)["ok"]
+        assert store.recorded == 2
+
+    agent._stream_supported = agent.FeatureSupport(r"\bstream")
+    store = store_at("replay")
+    for prompt in ("q1", "q2"):
+        result = agent.call_model_chat_completions(prompt, use_cache=False, stream_stop=STOP)
+        assert result["ok"] and result["replayed"] and result["text"] == "FINAL: 4"
+    agent.STREAM = False
+    assert agent.call_model_chat_completions("q1", use_cache=False)["ok"]
+    assert store.misses == 0
+
+
+def test_unrecorded_request_is_a_miss(store_at):
+    with MockChatServer(scripted=[(r".*", "FINAL: 4")]) as server:
+        store_at("record")
+        agent.call_model_chat_completions("q1", api_base=server.url, use_cache=False)
+    store = store_at("replay")
+    result = agent.call_model_chat_completions("q1", use_cache=False, temperature=0.7, sample=1)
+    assert not result["ok"] and result["replay_miss"]
+    assert store.misses == 1 and "q1" in store.miss_samples[0]
+
+
+def test_replay_needs_a_recording(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        replay.CallStore(tmp_path / "missing.sqlite", "replay")
+    with pytest.raises(ValueError):
+        replay.CallStore(tmp_path / "calls.sqlite", "rewind")
@@ -0,0 +1,64 @@
+import pytest
+
+import sandbox
+
+QUESTION = '''Write a function add_one(x) that returns x + 1.
+>>> add_one(2)
+3
+Return only the code.
+'''
+
+CORRECT = "def add_one(x):\n    return x + 1\n"
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = sandbox.SandboxPool(workers=1, cpu_seconds=2, wall_seconds=3)
+    yield pool
+    pool.close()
+
+
+def test_extract_tests_cuts_trailing_prose():
+    assert sandbox.extract_tests(QUESTION) == [">>> add_one(2)\n3\n"]
+
+
+def test_extract_tests_keeps_tracebacks_and_asserts():
+    question = ('def f(x):\n    """\n    >>> f(-1)\n    Traceback (most recent call last):\n      ...\n'
+                '    ValueError: negative\n    >>> f([1,\n    ...    2])\n    [1,\n     2]\n    """\n\n'
+                "assert f(1) == 1\nassert that the function is fast\n")
+    tests = sandbox.extract_tests(question)
+    assert tests[0].endswith("ValueError: negative\n")
+    assert tests[1] == ">>> f([1,\n...    2])\n[1,\n 2]\n"
+    assert tests[2:] == ["assert f(1) == 1", "assert that the function is fast"]
+
+
+def test_passed(pool):
+    result = pool.run(CORRECT, sandbox.extract_tests(QUESTION))
+    assert result.status == "passed" and result.tests_run == 1
+
+
+def test_failed(pool):
+    result = pool.run("def add_one(x):\n    return x + 2\n", sandbox.extract_tests(QUESTION))
+    assert result.status == "failed"
+    assert "Expected" in result.detail
+    result = pool.run(CORRECT, ["assert add_one(1) == 3"])
+    assert result.status == "failed" and "AssertionError" in result.detail
+
+
+def test_printed_text_mismatch_is_inconclusive(pool):
+    tests = sandbox.extract_tests(">>> greet('Bob')\nHello, Bob!\n")
+    assert pool.run("def greet(name):\n    print(f'Hello, {name}!')\n", tests).status == "passed"
+    assert pool.run("def greet(name):\n    print(f'Hi {name}')\n", tests).status == "inconclusive"
+
+
+def test_timeout(pool):
+    result = pool.run("def spin():\n    while True:\n        pass\n", [">>> spin()\n"])
+    assert result.status == "timeout"
+    # the pool recovers and keeps answering
+    assert pool.run(CORRECT, ["assert add_one(1) == 2"]).status == "passed"
+
+
+def test_inconclusive_and_no_tests(pool):
+    assert pool.run("import not_a_real_module_xyz\n", ["assert True"]).status == "inconclusive"
+    assert pool.run(CORRECT, ["assert that it works"]).status == "inconclusive"
+    assert pool.run(CORRECT, []).status == "no_tests"
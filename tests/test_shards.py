@@ -0,0 +1,63 @@
+import argparse
+import json
+
+import pytest
+
+from generate_answer_template import (build_answers, load_checkpoint, merge_shards, parse_shard, run_shard,
+                                      shard_of, shard_path)
+
+QUESTIONS = [{"input": f"question {i % 9}"} for i in range(24)] + [{"input": "Please compute 2 + 2."}, {"input": "compute 2 + 2."}]
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "questions.json"
+    path.write_text(json.dumps(QUESTIONS))
+    return path
+
+
+def test_parse_shard_and_paths(tmp_path):
+    assert parse_shard("2/8") == (2, 8)
+    for spec in ("8/8", "-1/4", "1", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(spec)
+    assert shard_path(tmp_path / "answers.json", 2, 8).name == "answers.shard-2-of-8.jsonl"
+    assert shard_path(tmp_path / "run.checkpoint.jsonl", 0, 2).name == "run.checkpoint.shard-0-of-2.jsonl"
+
+
+def test_duplicates_land_in_the_same_shard():
+    for num_shards in (2, 3, 7):
+        assert shard_of({"input": "Please compute 2 + 2."}, num_shards) == shard_of({"input": "compute 2 + 2."}, num_shards)
+
+
+@pytest.mark.parametrize("dedup_mode", ["off", "near"])
+def test_merged_shards_match_an_unsharded_run(tmp_path, input_path, fake_agent, dedup_mode):
+    expected = build_answers(QUESTIONS, checkpoint_path=None, dedup_mode=dedup_mode)
+    output = tmp_path / "answers.json"
+    for shard in range(3):
+        run_shard(shard, 3, input_path, output, checkpoint_path=tmp_path / "run.checkpoint.jsonl", dedup_mode=dedup_mode)
+    assert merge_shards(3, input_path, output) == len(QUESTIONS)
+    assert json.loads(output.read_text()) == expected
+
+
+def test_shard_checkpoints_use_input_indices(tmp_path, input_path, fake_agent, capsys):
+    fake_agent.fail = {"question 4"}
+    checkpoint = tmp_path / "run.checkpoint.jsonl"
+    shard = shard_of({"input": "question 4"}, 3)
+    run_shard(shard, 3, input_path, tmp_path / "answers.json", checkpoint_path=checkpoint, dedup_mode="off")
+    records = load_checkpoint(shard_path(checkpoint, shard, 3), include_errors=True)
+    assert all(QUESTIONS[idx]["input"].upper() == record["output"] or record.get("error")
+               for idx, record in records.items())
+    assert records[4]["error"] is True
+    assert "ERROR on question 5:" in capsys.readouterr().out
+
+
+def test_merge_refuses_missing_or_gapped_shards(tmp_path, input_path):
+    output = tmp_path / "answers.json"
+    with pytest.raises(FileNotFoundError):
+        merge_shards(2, input_path, output)
+    shard_path(output, 0, 2).write_text(json.dumps({"index": 0, "output": "a"}) + "\n")
+    shard_path(output, 1, 2).write_text(json.dumps({"index": 2, "output": "c"}) + "\n")
+    with pytest.raises(ValueError, match="expected question 1"):
+        merge_shards(2, input_path, output)
+    assert not output.exists()
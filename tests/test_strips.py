@@ -0,0 +1,114 @@
+import strips
+
+BLOCKSWORLD = """I am playing with a set of blocks where I need to arrange the blocks into stacks. Here are the actions I can do
+
+Pick up a block
+Unstack a block from on top of another block
+Put down a block
+Stack a block on top of another block
+
+I have the following restrictions on my actions:
+I can only pick up or unstack one block at a time.
+I can only pick up or unstack a block if my hand is empty.
+I can only pick up a block if the block is on the table and the block is clear. A block is clear if the block has no other blocks on top of it and if the block is not picked up.
+I can only unstack a block from on top of another block if the block I am unstacking was really on top of the other block.
+I can only unstack a block from on top of another block if the block I am unstacking is clear.
+Once I pick up or unstack a block, I am holding the block.
+I can only put down a block that I am holding.
+I can only stack a block on top of another block if I am holding the block being stacked.
+I can only stack a block on top of another block if the block onto which I am stacking the block is clear.
+Once I put down or stack a block, my hand becomes empty.
+Once you stack a block on top of a second block, the second block is no longer clear.
+
+[STATEMENT]
+As initial conditions I have that, the red block is clear, the blue block is clear, the yellow block is clear, the hand is empty, the blue block is on top of the orange block, the red block is on the table, the orange block is on the table and the yellow block is on the table.
+My goal is to have that the orange block is on top of the blue block.
+
+My plan is as follows:
+
+[PLAN]
+"""
+
+MYSTERY = """I am playing with a set of objects. Here are the actions I can do
+
+   Attack object
+   Feast object from another object
+   Succumb object
+   Overcome object from another object
+
+I have the following restrictions on my actions:
+    To perform Attack action, the following facts need to be true: Province object, Planet object, Harmony.
+    Once Attack action is performed the following facts will be true: Pain object.
+    Once Attack action is performed the following facts will be false: Province object, Planet object, Harmony.
+    To perform Succumb action, the following facts need to be true: Pain object.
+    Once Succumb action is performed the following facts will be true: Province object, Planet object, Harmony.
+    Once Succumb action is performed the following facts will be false: Pain object.
+    To perform Overcome action, the following needs to be true: Province other object, Pain object.
+    Once Overcome action is performed the following will be true: Harmony, Province object, Object Craves other object.
+    Once Overcome action is performed the following will be false: Province other object, Pain object.
+    To perform Feast action, the following needs to be true: Object Craves other object, Province object, Harmony.
+    Once Feast action is performed the following will be true: Pain object, Province other object.
+    Once Feast action is performed the following will be false:, Object Craves other object, Province object, Harmony.
+
+[STATEMENT]
+As initial conditions I have that, object a craves object b, harmony, planet object a, planet object c, planet object d, province object a, province object c and province object d.
+My goal is to have that object c craves object a.
+
+My plan is as follows:
+
+[PLAN]
+"""
+
+
+def test_parse_blocksworld_problem():
+    problem = strips.parse_problem(BLOCKSWORLD)
+    assert problem is not None
+    assert set(problem.actions) == {"pickup", "unstack", "putdown", "stack"}
+    assert {"blue is on top of orange", "red is on the table", "the hand is empty"} <= problem.initial
+    assert problem.goal == {"orange is on top of blue"}
+
+
+def test_blocksworld_valid_plan_in_both_styles():
+    plans = [
+        "(unstack blue orange)\n(put-down blue)\n(pick-up orange)\n(stack orange blue)\n[PLAN END]",
+        "unstack the blue block from on top of the orange block\nput down the blue block\n"
+        "pick up the orange block\nstack the orange block on top of the blue block",
+    ]
+    for plan in plans:
+        assert strips.check_plan(BLOCKSWORLD, plan).valid
+
+
+def test_blocksworld_inapplicable_step():
+    # the orange block still has the blue one on top of it
+    check = strips.check_plan(BLOCKSWORLD, "(pick-up orange)\n(stack orange blue)")
+    assert not check.valid
+    assert check.step == 1
+    assert "not applicable" in check.reason
+
+
+def test_blocksworld_goal_not_reached():
+    check = strips.check_plan(BLOCKSWORLD, "(unstack blue orange)\n(put-down blue)")
+    assert not check.valid
+    assert check.step == 3
+
+
+def test_mystery_domain_rules_are_parsed():
+    problem = strips.parse_problem(MYSTERY)
+    assert problem is not None
+    assert {name: schema.arity for name, schema in problem.actions.items()} == {
+        "attack": 1, "succumb": 1, "overcome": 2, "feast": 2}
+    assert strips.check_plan(MYSTERY, "(attack c)\n(overcome c a)").valid
+
+
+def test_mystery_domain_rejects_wrong_plan():
+    # overcome needs pain on c, which only attack gives
+    check = strips.check_plan(MYSTERY, "(overcome c a)")
+    assert not check.valid and check.step == 1
+    check = strips.check_plan(MYSTERY, "(attack c)\n(attack d)")
+    assert not check.valid and check.step == 2
+
+
+def test_unparseable_problem_and_empty_plan():
+    assert strips.check_plan("What is 2 + 2?", "(stack a b)") is None
+    check = strips.check_plan(BLOCKSWORLD, "")
+    assert not check.valid and check.step == 1
@@ -0,0 +1,51 @@
+import pytest
+
+import validators
+
+MC_QUESTION = "Which is a mammal?\n(A) shark\n(B) whale\n(C) trout"
+
+
+@pytest.mark.parametrize("question, answer, domain, expected", [
+    ("What is 6 * 7?", "42", "math", True),
+    ("What is 1/3 + 1/6?", "1/2", "math", True),
+    ("What is 6 * 7?", "The answer is 42", "math", False),
+    ("Put the final answer in \\boxed{}.", "\\boxed{3.5}", "math", True),
+    ("Put the final answer in \\boxed{}.", "3.5", "math", None),
+    ("Simplify 2/4 as a fraction.", "\\frac{1}{2}", "math", None),
+    ("Simplify sqrt(12).", "2\\sqrt{3}", "math", None),
+    ("What is 6 * 7?", "$42$", "math", True),
+    ("What is 6 * 7?", "FINAL: 42", "math", False),
+    ("What is 6 * 7?", "6 * 7 =\n42", "math", False),
+    (MC_QUESTION, "B", "common sense", True),
+    (MC_QUESTION, "(b)", "common sense", True),
+    (MC_QUESTION, "D", "common sense", False),
+    ("Is the sky blue? Answer yes or no.", "Yes", "common sense", True),
+    ("Is the sky blue? Answer yes or no.", "Probably", "common sense", False),
+    ("Who wrote Hamlet?", "Shakespeare", "common sense", None),
+    ("Will it rain? Answer \\boxed{Yes} or \\boxed{No}.", "\\boxed{No}", "future prediction", True),
+    ("[PLAN]", "(unstack red blue)\n(put-down red)", "planning", True),
+    ("[PLAN]", "First unstack red, then put it down.", "planning", False),
+    ("Write f.", "def f(x):\n    return x + 1", "coding", True),
+    ("Write a Python function f.", "def f(x) return x", "coding", False),
+    ("Write f.", "```python\ndef f(x):\n    return x + 1\n```", "coding", True),
+    ("Write a SQL query listing all users.", "SELECT * FROM users", "coding", None),
+    ("Write f.", "", "coding", False),
+    ("Anything", "anything", "unknown domain", None),
+])
+def test_verdict(question, answer, domain, expected):
+    assert validators.verdict(question, answer, domain) is expected
+    assert validators.is_well_formed(question, answer, domain) is (expected is True)
+
+
+def test_any_false_rejects():
+    # yes/no and option letters both apply: one False is enough
+    question = "Is it (A) red or (B) blue? Answer yes or no."
+    assert validators.verdict(question, "A", "common sense") is False
+
+
+def test_early_exit_stats():
+    stats = validators.EarlyExitStats()
+    stats.record(True, 2)
+    # a rejected check that spent a repair call
+    stats.record(False, -1)
+    assert stats.as_dict() == {"checked": 2, "accepted": 1, "calls_saved": 1}
@@ -0,0 +1,189 @@
+"""
+Lightweight per-question tracing.
+
+Each question solved inside trace_question() gets a trace; span() blocks inside
+it (pipeline stages and individual LLM calls) are timed and collected, then
+written to a JSONL file when the question finishes, one line per span. Outside
+of a trace, span() is a no-op so the agent can be used without any setup.
+
+The current trace and parent span live in ContextVars, so spans opened in
+worker threads started through agent._map_in_context land in the right trace.
+"""
+
+from __future__ import annotations
+
+import functools
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[Optional[int]] = ContextVar("span_parent", default=None)
+
+# fields copied out of the OpenAI-style "usage" block of a response
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class Tracer:
+    """Collects finished spans; optionally appends them to a JSONL file."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path is not None else None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._fp = self.path.open("a", encoding="utf-8") if self.path is not None else None
+
+    def export(self, spans: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.spans.extend(spans)
+            if self._fp is not None:
+                for span in spans:
+                    self._fp.write(json.dumps(span, ensure_ascii=False) + "\n")
+                self._fp.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per (domain, span name) with counts, latency percentiles and token totals."""
+        groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            groups[(span.get("domain", "?"), span["name"])].append(span)
+
+        rows = []
+        for (domain, name), items in sorted(groups.items()):
+            durations = [s["duration"] for s in items]
+            rows.append({
+                "domain": domain,
+                "name": name,
+                "count": len(items),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "total": sum(durations),
+                "prompt_tokens": sum(s.get("prompt_tokens", 0) for s in items),
+                "completion_tokens": sum(s.get("completion_tokens", 0) for s in items),
+            })
+        return rows
+
+    def format_summary(self) -> str:
+        header = f"{'domain':<18}{'span':<16}{'count':>7}{'p50 s':>9}{'p95 s':>9}{'total s':>10}{'prompt tok':>12}{'compl tok':>11}"
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            lines.append(
+                f"{row['domain']:<18}{row['name']:<16}{row['count']:>7}{row['p50']:>9.3f}{row['p95']:>9.3f}"
+                f"{row['total']:>10.1f}{row['prompt_tokens']:>12}{row['completion_tokens']:>11}"
+            )
+        return "\n".join(lines)
+
+
+class Trace:
+    def __init__(self, tracer: Tracer, trace_id: Any, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.attrs = dict(attrs)
+        self.spans: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def flush(self) -> None:
+        # trace-level attributes (e.g. domain, known only after classification) go on every span
+        with self._lock:
+            spans = [{"trace": self.trace_id, **self.attrs, **span} for span in self.spans]
+            self.spans = []
+        self.tracer.export(spans)
+
+
+@contextmanager
+def trace_question(tracer: Optional[Tracer], trace_id: Any, **attrs: Any) -> Iterator[Optional[Trace]]:
+    """Opens a trace for one question; its spans are exported when the block exits."""
+    if tracer is None:
+        yield None
+        return
+    trace = Trace(tracer, trace_id, attrs)
+    token = _trace.set(trace)
+    try:
+        with span("question"):
+            yield trace
+    finally:
+        _trace.reset(token)
+        trace.flush()
+
+
+def annotate(**attrs: Any) -> None:
+    """Sets attributes on the current trace (copied onto all of its spans)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Times the enclosed block. Yields a dict the caller can add fields to
+    (status, token usage, ...); it is recorded with the span.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield attrs
+        return
+    span_id = trace.next_id()
+    token = _parent.set(span_id)
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        _parent.reset(token)
+        trace.add({
+            "span": span_id,
+            "parent": _parent.get(),
+            "name": name,
+            "start": round(start_wall, 6),
+            "duration": round(time.perf_counter() - start, 6),
+            **attrs,
+        })
+
+
+def traced(name: str):
+    """Decorator form of span() for pipeline stages."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(attrs: Dict[str, Any], raw: Optional[Dict[str, Any]]) -> None:
+    usage = (raw or {}).get("usage") or {}
+    for field in USAGE_FIELDS:
+        if isinstance(usage.get(field), int):
+            attrs[field] = usage[field]
@@ -0,0 +1,150 @@
+"""
+Cheap local answer checks used to skip the LLM format-verification call.
+They look at the form of an answer, not whether it is right, so they never
+replace CoT voting or an execution / simulation check.
+
+Each validator takes (question, answer) and returns True when the answer is
+clearly well-formed for the question, False when it is clearly not, and None
+when the check doesn't apply or can't tell (a symbolic math answer such as
+\frac{1}{2}). False sends the answer to the stronger model, so it is kept
+for answers that are plainly malformed: prose, several lines, a leftover
+"FINAL:", code that doesn't parse. verdict() combines them: True (accept) if at
+least one validator for the domain says True and none says False, False
+(reject) if any says False, None (unknown) if none applies.
+
+Add more with @register("domain").
+"""
+
+from __future__ import annotations
+
+import ast
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+from sandbox import strip_code_fences
+
+Validator = Callable[[str, str], Optional[bool]]
+
+VALIDATORS: Dict[str, List[Validator]] = {}
+
+
+def register(*domains: str):
+    def decorator(fn: Validator) -> Validator:
+        for domain in domains:
+            VALIDATORS.setdefault(domain, []).append(fn)
+        return fn
+    return decorator
+
+
+NUMBER_RE = re.compile(r"^-?(\d+(\.\d+)?|\.\d+)(/\d+)?$")
+BOXED_RE = re.compile(r"^\\boxed\{(.+)\}$", re.DOTALL)
+PLAN_LINE_RE = re.compile(r"^\(\s*[\w-]+(\s+[\w-]+)*\s*\)$")
+# "(A) ...", "A) ...", "A. ..." at the start of a line
+OPTION_RE = re.compile(r"^\s*\(?([A-J])[\).:]\s+\S", re.MULTILINE)
+YES_NO_RE = re.compile(r"\byes\s*(/|or)\s*no\b", re.IGNORECASE)
+FINAL_PREFIX_RE = re.compile(r"^\s*final\s*:", re.IGNORECASE)
+LATEX_COMMAND_RE = re.compile(r"\\[A-Za-z]+")
+WORD_RE = re.compile(r"\b[A-Za-z]{2,}\b")
+# this many words (LaTeX commands aside) make an answer a sentence rather than a value
+PROSE_WORDS = 3
+
+
+def is_malformed(answer: str) -> bool:
+    """Several lines, a leftover "FINAL:" or a sentence where a short answer belongs."""
+    answer = answer.strip()
+    if not answer or "\n" in answer or FINAL_PREFIX_RE.match(answer):
+        return True
+    return len(WORD_RE.findall(LATEX_COMMAND_RE.sub(" ", answer))) >= PROSE_WORDS
+
+
+@register("math")
+def math_number_form(question: str, answer: str) -> Optional[bool]:
+    """
+    True for a plain number (\\boxed{number} when the question asks for boxed output),
+    False for a malformed answer, None for anything else (\\frac{1}{2}, 2\\sqrt{3}, x = 3).
+    """
+    if is_malformed(answer):
+        return False
+    answer = answer.strip().strip("$").strip()
+    if "\\boxed" in question:
+        m = BOXED_RE.match(answer)
+        return True if m and NUMBER_RE.match(m.group(1).strip()) else None
+    return True if NUMBER_RE.match(answer) else None
+
+
+@register("common sense", "future prediction")
+def yes_no_form(question: str, answer: str) -> Optional[bool]:
+    if not YES_NO_RE.search(question):
+        return None
+    return answer.strip().upper() in ("YES", "NO")
+
+
+@register("common sense")
+def option_letter_form(question: str, answer: str) -> Optional[bool]:
+    options = set(OPTION_RE.findall(question))
+    if len(options) < 2:
+        return None
+    return answer.strip().strip("()").upper() in options
+
+
+@register("future prediction")
+def boxed_form(question: str, answer: str) -> Optional[bool]:
+    if "\\boxed" not in question:
+        return None
+    return bool(BOXED_RE.match(answer.strip()))
+
+
+@register("planning")
+def plan_lines_form(question: str, answer: str) -> Optional[bool]:
+    lines = [line.strip() for line in answer.strip().splitlines() if line.strip()]
+    return bool(lines) and all(PLAN_LINE_RE.match(line) for line in lines)
+
+
+@register("coding")
+def code_parses(question: str, answer: str) -> Optional[bool]:
+    """Python (fences stripped, as the sandbox does) must parse; other languages can't be told apart."""
+    code = strip_code_fences(answer)
+    if not code or FINAL_PREFIX_RE.match(code):
+        return False
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return False if "python" in question.lower() or "def " in question else None
+    return True
+
+
+def verdict(question: str, answer: str, domain: str) -> Optional[bool]:
+    verdicts = [validator(question, answer) for validator in VALIDATORS.get(domain, [])]
+    if any(v is False for v in verdicts):
+        return False
+    if any(v is True for v in verdicts):
+        return True
+    return None
+
+
+def is_well_formed(question: str, answer: str, domain: str) -> bool:
+    return verdict(question, answer, domain) is True
+
+
+class EarlyExitStats:
+    def __init__(self):
+        self.checked = 0
+        self.accepted = 0
+        self.calls_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, accepted: bool, calls_saved: int) -> None:
+        """calls_saved is net: calls skipped minus calls spent on the check (repairs), so it can be negative."""
+        with self._lock:
+            self.checked += 1
+            if accepted:
+                self.accepted += 1
+            self.calls_saved += calls_saved
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {"checked": self.checked, "accepted": self.accepted, "calls_saved": self.calls_saved}
+
+
+STATS = EarlyExitStats()